@@ -1,44 +1,3046 @@
-import datetime
+import asyncio
+import bisect
+import calendar
+import collections
+import contextlib
+import contextvars
+import copy
+import cProfile
+import functools
+import gzip
 import hashlib
 import hmac
+import html
+import io
+import json
 import logging
+import logging.handlers
+import math
+import os
+import pstats
+import queue
+import random
+import re
+import signal
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree
 
+from email.utils import formatdate, parsedate_to_datetime
 from mimetypes import guess_type
+from urllib.parse import quote, unquote, unquote_plus
 
 # https://www.tornadoweb.org/
 # python3 -m pip install --upgrade pip tornado
 import tornado.httpclient
 import tornado.httpserver
+import tornado.httputil
+import tornado.ioloop
+import tornado.iostream
+import tornado.locks
+import tornado.netutil
+import tornado.process
+import tornado.queues
+import tornado.simple_httpclient
+import tornado.tcpclient
 import tornado.web
 
 __version__ = "0.0.1a"
 
+logger = logging.getLogger(__name__)
+
 # f-string support
 NL = "\n"
 TB = "\t"
 CR = "\r"
 
+# Payload hashes used to sign request bodies which are streamed upstream
+# https://docs.aws.amazon.com/AmazonS3/latest/API/sig-v4-header-based-auth.html
+EMPTY_PAYLOAD = hashlib.sha256(b"").hexdigest()
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+STREAMING_PAYLOAD = "STREAMING-AWS4-HMAC-SHA256-PAYLOAD"
+
+# https://docs.aws.amazon.com/AmazonS3/latest/userguide/qfacts.html
+MIN_PART_SIZE = 5 * 1024**2
+MAX_PARTS = 10000
+
+
+class KeepAliveTCPClient(tornado.tcpclient.TCPClient):
+    """A TCP client which reuses idle connections
+
+    Connections released after a complete HTTP/1.1 exchange are kept for up
+    to `idle_timeout' seconds and handed out again, most recently used first,
+    to requests for the same host, port and scheme.
+
+    See Also:
+      https://www.tornadoweb.org/en/stable/tcpclient.html
+    """
+
+    def __init__(self, resolver=None, max_idle: int = 10, idle_timeout: float = 15):
+        super().__init__(resolver=resolver)
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.idle = collections.defaultdict(collections.deque)
+        self.reused = 0
+
+    async def connect(self, host: str, port: int, ssl_options=None, **kwargs):
+        idle = self.idle[(host, port, ssl_options is not None)]
+        now = time.monotonic()
+        while idle:
+            stream, released = idle.pop()
+            if stream.closed():
+                continue
+            if now - released > self.idle_timeout:
+                stream.close()
+                continue
+            stream.set_close_callback(None)
+            # The other end may have closed it since; see `StreamingHTTPConnection'
+            stream.reused = True
+            self.reused += 1
+            return stream
+        return await super().connect(host, port, ssl_options=ssl_options, **kwargs)
+
+    def release(self, key: tuple, stream: tornado.iostream.IOStream):
+        """Keep a connection for reuse by a later request"""
+        idle = self.idle[key]
+        if stream.closed() or len(idle) >= self.max_idle:
+            stream.close()
+            return
+        entry = (stream, time.monotonic())
+        idle.append(entry)
+
+        def on_close():
+            # Forget the connection when it is closed by the other end
+            if entry in idle:
+                idle.remove(entry)
+
+        stream.set_close_callback(on_close)
+
+    def idle_count(self) -> int:
+        return sum(len(idle) for idle in self.idle.values())
+
+    def close(self):
+        for idle in self.idle.values():
+            while idle:
+                idle.pop()[0].close()
+        super().close()
+
+
+class StreamingHTTPConnection(tornado.simple_httpclient._HTTPConnection):
+    """An HTTP client connection which applies backpressure to streamed bodies
+
+    The stock connection discards the value returned by `streaming_callback'.
+    Returning it here lets the underlying HTTP/1.x connection await it before
+    the next chunk is read from upstream. When the client has keep-alive
+    enabled the connection is released for reuse instead of being closed.
+    A request whose reused connection was closed by upstream before any
+    response arrived is retried once on a new connection, unless its body
+    was streamed and can not be sent again.
+
+    This relies on the internals of `tornado.simple_httpclient', which is
+    why tornado is pinned to a tested major version.
+
+    See Also:
+      https://www.tornadoweb.org/en/stable/httpclient.html#tornado.httpclient.HTTPRequest
+    """
+
+    def _create_connection(self, stream: tornado.iostream.IOStream):
+        # Replace the `Connection: close' header set for every request
+        if getattr(self.client, "keep_alive", False):
+            self.request.headers["Connection"] = "keep-alive"
+        # Let the request be abandoned by closing its connection
+        self.request.request.stream = stream
+        timings = getattr(self.request.request, "timings", None)
+        if timings is not None:
+            timings.first(
+                "upstream_connect", time.monotonic() - self.request.request.started
+            )
+        if getattr(self.request, "cancelled", False):
+            stream.close()
+        return super()._create_connection(stream)
+
+    def _handle_exception(self, typ, value, tb) -> bool:
+        if not self.retryable(value):
+            return super()._handle_exception(typ, value, tb)
+        logger.info(f"Retrying {self.request.url} on a new connection: {value!r}")
+        # Hand the callbacks to the new connection so the client slot is kept
+        release_callback, self.release_callback = self.release_callback, None
+        final_callback, self.final_callback = self.final_callback, None
+        self._remove_timeout()
+        self.stream.close()
+        type(self)(
+            self.client,
+            self.request,
+            release_callback,
+            final_callback,
+            self.max_buffer_size,
+            # Connections are not reused for the retry
+            tornado.tcpclient.TCPClient(resolver=self.client.resolver),
+            self.max_header_size,
+            self.max_body_size,
+        )
+        return True
+
+    def retryable(self, error: BaseException) -> bool:
+        """Return True when a failed request can be retried on a new connection"""
+        return (
+            self.final_callback is not None
+            and self.client is not None
+            and getattr(getattr(self, "stream", None), "reused", False)
+            and self.code is None
+            and self.request.body_producer is None
+            and isinstance(
+                error,
+                (
+                    tornado.iostream.StreamClosedError,
+                    tornado.simple_httpclient.HTTPStreamClosedError,
+                    ConnectionError,
+                ),
+            )
+        )
+
+    async def headers_received(self, first_line, headers):
+        self.response_version = first_line.version
+        return await super().headers_received(first_line, headers)
+
+    def data_received(self, chunk: bytes):
+        if self._should_follow_redirect():
+            return
+        if self.request.streaming_callback is not None:
+            return self.request.streaming_callback(chunk)
+        self.chunks.append(chunk)
+
+    def _on_end_request(self):
+        if not self.reusable():
+            self.stream.close()
+            return
+        port = tornado.httputil.split_host_and_port(self.parsed.netloc)[1]
+        https = self.parsed.scheme == "https"
+        key = (self.parsed_hostname, port or (443 if https else 80), https)
+        self.client.tcp_client.release(key, self.connection.detach())
+
+    def reusable(self) -> bool:
+        """Return True when the connection may carry another request"""
+        return (
+            getattr(self.client, "keep_alive", False)
+            and not self.stream.closed()
+            and self.connection.stream is not None
+            and self.connection._write_finished
+            and getattr(self, "response_version", None) == "HTTP/1.1"
+            and (self.headers.get("Connection") or "").lower() != "close"
+        )
+
+
+class StreamingAsyncHTTPClient(tornado.simple_httpclient.SimpleAsyncHTTPClient):
+    """A non-blocking HTTP client using `StreamingHTTPConnection'
+
+    Adds keep-alive connection reuse, a queue timeout separate from the
+    request timeouts and a record of the time requests wait in the queue
+    for one of `max_clients' slots.
+    """
+
+    def initialize(
+        self,
+        keep_alive: bool = False,
+        queue_timeout: float | None = None,
+        on_dequeue=None,
+        **kwargs,
+    ):
+        super().initialize(**kwargs)
+        self.keep_alive = keep_alive
+        self.queue_timeout = queue_timeout
+        self.on_dequeue = on_dequeue
+        if keep_alive:
+            self.tcp_client.close()
+            self.tcp_client = KeepAliveTCPClient(
+                resolver=self.resolver, max_idle=self.max_clients
+            )
+
+    def _connection_class(self) -> type:
+        return StreamingHTTPConnection
+
+    def fetch_impl(self, request, callback):
+        request.queued = self.io_loop.time()
+        if not self.queue_timeout or len(self.active) < self.max_clients:
+            return super().fetch_impl(request, callback)
+        # The same as the parent class using `queue_timeout' for queued requests
+        key = object()
+        self.queue.append((key, request, callback))
+        timeout_handle = self.io_loop.add_timeout(
+            self.io_loop.time() + self.queue_timeout,
+            functools.partial(self._on_timeout, key, "in request queue"),
+        )
+        self.waiting[key] = (request, callback, timeout_handle)
+        self._process_queue()
+
+    def _handle_request(self, request, release_callback, final_callback):
+        if self.on_dequeue is not None:
+            self.on_dequeue(self.io_loop.time() - request.queued)
+        super()._handle_request(request, release_callback, final_callback)
+
+
+# Histogram buckets in seconds, from a cached signature to a slow upstream
+LATENCY_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class Histogram:
+    """Count observations in fixed buckets for a Prometheus histogram
+
+    See Also:
+      https://prometheus.io/docs/concepts/metric_types/#histogram
+    """
+
+    __slots__ = ("bounds", "count", "counts", "sum")
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS):
+        self.bounds = bounds
+        # The last bucket counts observations above every bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate the `q' quantile by interpolating within its bucket"""
+        rank = q * self.count
+        cumulative, lower = 0, 0.0
+        for bound, count in zip(self.bounds, self.counts):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return self.bounds[-1]
+
+    def expose(self, name: str, labels: str = "") -> list:
+        """Return the histogram in the Prometheus text format"""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {self.count}')
+        labels = f"{{{labels.rstrip(',')}}}" if labels else ""
+        lines.append(f"{name}_sum{labels} {self.sum}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class RequestTimings:
+    """Time the phases of one request for its `Server-Timing' header
+
+    Upstream phases are timed from the start of the upstream request: to its
+    connection being ready, which includes any wait for a free connection,
+    and to its first byte. Only the first upstream request of a request is
+    counted for these; signing and upstream time add up over all of them.
+
+    See Also:
+      https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing
+    """
+
+    __slots__ = ("phases", "started")
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = {}
+
+    def add(self, phase: str, seconds: float):
+        """Add time spent in a phase"""
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def first(self, phase: str, seconds: float):
+        """Record the time of a phase unless it was already recorded"""
+        self.phases.setdefault(phase, seconds)
+
+    def header(self) -> str:
+        """Return the `Server-Timing' header value, with the time so far"""
+        return ", ".join(
+            f"{phase};dur={1000.0 * seconds:.3f}"
+            for phase, seconds in [
+                *self.phases.items(),
+                ("total", time.monotonic() - self.started),
+            ]
+        )
+
+
+# The timings of the request being handled, for upstream requests it makes
+REQUEST_TIMINGS = contextvars.ContextVar("request_timings", default=None)
+
+
+class Metrics:
+    """Collect request metrics for the Prometheus text format
+
+    Everything is a plain counter or a `Histogram' updated in place, so
+    collecting costs a few additions per request. Each worker process
+    collects and reports its own metrics.
+
+    See Also:
+      https://prometheus.io/docs/instrumenting/exposition_formats/
+    """
+
+    prefix = "object_storage"
+
+    def __init__(self):
+        # Requests by method then status code
+        self.requests = collections.defaultdict(lambda: collections.defaultdict(int))
+        self.in_flight = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        # Requests refused with a 503 by reason
+        self.rejected = collections.Counter()
+        # Time spent in each phase of a request
+        self.phases = {
+            "signing": Histogram(),
+            "upstream_first_byte": Histogram(),
+            "upstream_total": Histogram(),
+            "client_write": Histogram(),
+        }
+        self.signing = self.phases["signing"]
+        self.upstream_first_byte = self.phases["upstream_first_byte"]
+        self.upstream_total = self.phases["upstream_total"]
+        self.client_write = self.phases["client_write"]
+
+    def expose(
+        self,
+        upstream=None,
+        cache=None,
+        flights=None,
+        access_log=None,
+        router=None,
+        negative_cache=None,
+        metadata_index=None,
+        admission=None,
+    ) -> str:
+        """Return the metrics in the Prometheus text format"""
+        prefix = self.prefix
+        lines = [
+            f"# HELP {prefix}_requests_total Requests handled by method and status.",
+            f"# TYPE {prefix}_requests_total counter",
+        ]
+        for method, statuses in sorted(self.requests.items()):
+            for status, count in sorted(statuses.items()):
+                lines.append(
+                    f'{prefix}_requests_total{{method="{method}",status="{status}"}} {count}'
+                )
+        lines += [
+            f"# HELP {prefix}_phase_seconds Time spent in each phase of a request.",
+            f"# TYPE {prefix}_phase_seconds histogram",
+        ]
+        for phase, histogram in self.phases.items():
+            lines += histogram.expose(f"{prefix}_phase_seconds", f'phase="{phase}",')
+        lines += [
+            f"# HELP {prefix}_rejected_requests_total Requests refused with a 503 by reason.",
+            f"# TYPE {prefix}_rejected_requests_total counter",
+        ]
+        lines += [
+            f'{prefix}_rejected_requests_total{{reason="{reason}"}} {self.rejected[reason]}'
+            for reason in ["overload", "circuit_open"]
+        ]
+        if router is not None:
+            now = time.monotonic()
+            lines += [
+                f"# HELP {prefix}_upstream_endpoint_outstanding Upstream requests in progress by endpoint.",
+                f"# TYPE {prefix}_upstream_endpoint_outstanding gauge",
+            ]
+            lines += [
+                f'{prefix}_upstream_endpoint_outstanding{{endpoint="{address}"}} {endpoint.outstanding}'
+                for address, endpoint in sorted(router.endpoints.items())
+            ]
+            lines += [
+                f"# HELP {prefix}_upstream_endpoint_ejected Whether an endpoint is ejected for failing.",
+                f"# TYPE {prefix}_upstream_endpoint_ejected gauge",
+            ]
+            lines += [
+                f'{prefix}_upstream_endpoint_ejected{{endpoint="{address}"}} {int(endpoint.ejected(now))}'
+                for address, endpoint in sorted(router.endpoints.items())
+            ]
+
+        gauges = {
+            "requests_in_flight": ("gauge", "Requests being handled.", self.in_flight),
+            "received_bytes_total": (
+                "counter",
+                "Request body bytes received from clients.",
+                self.bytes_received,
+            ),
+            "sent_bytes_total": (
+                "counter",
+                "Response body bytes sent to clients.",
+                self.bytes_sent,
+            ),
+        }
+        if upstream is not None:
+            stats = upstream.stats()
+            gauges["upstream_active"] = (
+                "gauge",
+                "Upstream requests in progress.",
+                stats["active"],
+            )
+            gauges["upstream_queued"] = (
+                "gauge",
+                "Upstream requests waiting for a connection.",
+                stats["queued"],
+            )
+            gauges["upstream_idle_connections"] = (
+                "gauge",
+                "Idle upstream connections kept alive.",
+                stats["idle"],
+            )
+            gauges["upstream_retries_total"] = (
+                "counter",
+                "Upstream GET/HEAD requests retried.",
+                stats["retries"],
+            )
+            gauges["upstream_hedges_total"] = (
+                "counter",
+                "Second upstream GET/HEAD requests sent for slow requests.",
+                stats["hedges"],
+            )
+            gauges["upstream_hedges_won_total"] = (
+                "counter",
+                "Second upstream requests which responded first.",
+                stats["hedges_won"],
+            )
+        if cache is not None:
+            stats = cache.stats()
+            lookups = stats["hits"] + stats["misses"]
+            gauges["cache_hits_total"] = (
+                "counter",
+                "Object cache hits.",
+                stats["hits"],
+            )
+            gauges["cache_misses_total"] = (
+                "counter",
+                "Object cache misses.",
+                stats["misses"],
+            )
+            gauges["cache_stale_total"] = (
+                "counter",
+                "Expired objects served from the cache.",
+                stats["stale"],
+            )
+            gauges["cache_hit_ratio"] = (
+                "gauge",
+                "Object cache hits per lookup.",
+                stats["hits"] / lookups if lookups else 0.0,
+            )
+            gauges["cache_bytes"] = (
+                "gauge",
+                "Object cache memory used.",
+                stats["size"],
+            )
+            if "disk" in stats:
+                gauges["cache_disk_bytes"] = (
+                    "gauge",
+                    "Object cache disk space used.",
+                    stats["disk"]["size"],
+                )
+        if negative_cache is not None:
+            stats = negative_cache.stats()
+            gauges["negative_cache_hits_total"] = (
+                "counter",
+                "Requests answered from the cache of missing objects.",
+                stats["hits"],
+            )
+            gauges["negative_cache_entries"] = (
+                "gauge",
+                "Objects remembered as missing or forbidden.",
+                stats["entries"],
+            )
+        if admission is not None:
+            stats = admission.stats()
+            gauges["admission_waiting"] = (
+                "gauge",
+                "Requests waiting for a place to start.",
+                stats["waiting"],
+            )
+            gauges["admission_queued_total"] = (
+                "counter",
+                "Requests which waited for a place to start.",
+                stats["queued"],
+            )
+            gauges["admission_buffered_bytes"] = (
+                "gauge",
+                "Body bytes held in memory by requests in progress.",
+                stats["buffered"],
+            )
+        if metadata_index is not None:
+            stats = metadata_index.stats()
+            gauges["metadata_index_hits_total"] = (
+                "counter",
+                "Requests answered from the object metadata index.",
+                stats["hits"],
+            )
+            gauges["metadata_index_entries"] = (
+                "gauge",
+                "Objects in the metadata index.",
+                stats["entries"],
+            )
+        if flights is not None:
+            stats = flights.stats()
+            gauges["coalesced_requests_total"] = (
+                "counter",
+                "Requests which shared an upstream request already in flight.",
+                stats["joined"],
+            )
+        if access_log is not None:
+            gauges["access_log_sampled_out_total"] = (
+                "counter",
+                "Requests left out of the access log by sampling.",
+                access_log.sampled_out,
+            )
+        gauges["log_records_dropped_total"] = (
+            "counter",
+            "Log records dropped because the log queue was full.",
+            sum(
+                handler.dropped
+                for logger_name in ["", "tornado.access"]
+                for handler in logging.getLogger(logger_name).handlers
+                if isinstance(handler, LogQueueHandler)
+            ),
+        )
+        for metric, (metric_type, metric_help, value) in gauges.items():
+            lines += [
+                f"# HELP {prefix}_{metric} {metric_help}",
+                f"# TYPE {prefix}_{metric} {metric_type}",
+                f"{prefix}_{metric} {value}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+class AccessLog:
+    """Log handled requests in the text or JSON format, sampled by status
+
+    `sample' maps status codes ("404"), status classes ("2xx") or "default"
+    to the fraction of those requests which are logged, for example
+    "2xx=0.01,3xx=0.1" logs every error but only 1% of successful requests.
+    Nothing is built for a request which is not logged.
+
+    See Also:
+      https://www.tornadoweb.org/en/stable/web.html#tornado.web.Application.log_request
+    """
+
+    def __init__(self, log_format: str = "text", sample: str | None = None):
+        if log_format not in ["text", "json", "off"]:
+            raise ValueError(f"Unknown access log format: {log_format!r}")
+        self.format = log_format
+        self.sample = self.parse_sample(sample)
+        # Sampling rates by status code, resolved on first use
+        self.rates = {}
+        self.sampled_out = 0
+        self.logger = logging.getLogger("tornado.access")
+
+    @staticmethod
+    def parse_sample(sample: str | None = None) -> dict:
+        """Parse "status=rate,..." into a dict of rates"""
+        rates = {}
+        for item in (sample or "").split(","):
+            if not item.strip():
+                continue
+            status, _, rate = item.partition("=")
+            rate = float(rate)
+            if not 0.0 <= rate <= 1.0:
+                raise ValueError(f"Access log sample rate out of range: {item!r}")
+            rates[status.strip().lower()] = rate
+        return rates
+
+    def rate(self, status: int) -> float:
+        """Return the fraction of responses with `status' which are logged"""
+        rate = self.rates.get(status)
+        if rate is None:
+            rate = self.sample.get(
+                str(status),
+                self.sample.get(f"{status // 100}xx", self.sample.get("default", 1.0)),
+            )
+            self.rates[status] = rate
+        return rate
+
+    def __call__(self, handler: tornado.web.RequestHandler):
+        if self.format == "off":
+            return
+        status = handler.get_status()
+        if status < 400:
+            level = logging.INFO
+        elif status < 500:
+            level = logging.WARNING
+        else:
+            level = logging.ERROR
+        if not self.logger.isEnabledFor(level):
+            return
+        rate = self.rate(status)
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return
+        request = handler.request
+        duration = 1000.0 * request.request_time()
+        if self.format == "text":
+            self.logger.log(
+                level, "%d %s %.2fms", status, handler._request_summary(), duration
+            )
+            return
+        payload = {
+            "time": round(time.time(), 3),
+            "status": status,
+            "method": request.method,
+            "path": request.path,
+            "query": request.query,
+            "duration_ms": round(duration, 3),
+            "bytes_sent": getattr(handler, "bytes_sent", None),
+            "remote_ip": request.remote_ip,
+            "user_agent": request.headers.get("User-Agent"),
+            "cache": getattr(handler, "cache_status", None),
+            "pid": os.getpid(),
+        }
+        self.logger.log(level, "%s", json.dumps(payload, separators=(",", ":")))
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Pass log records to a background thread, dropping them when it lags
+
+    Records are formatted by the caller but written by the thread of a
+    `logging.handlers.QueueListener', so a slow terminal or journal never
+    blocks the IOLoop. When the queue is full the record is dropped.
+    """
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def start_log_queue(max_size: int = 10000, loggers=("", "tornado.access")) -> list:
+    """Move the handlers of `loggers' behind bounded queues
+
+    Threads do not survive a fork so this is called in each worker. Returns
+    the started `logging.handlers.QueueListener' objects.
+
+    See Also:
+      https://docs.python.org/3/howto/logging-cookbook.html#dealing-with-handlers-that-block
+    """
+    listeners = []
+    for logger_name in loggers:
+        logger = logging.getLogger(logger_name)
+        if not logger.handlers:
+            continue
+        listener = logging.handlers.QueueListener(
+            queue.Queue(max_size), *logger.handlers, respect_handler_level=True
+        )
+        logger.handlers = [LogQueueHandler(listener.queue)]
+        listener.start()
+        listeners.append(listener)
+    return listeners
+
+
+# Upstream response codes which are worth retrying, including 503 SlowDown
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class AdmissionControl:
+    """Limit the requests in progress, queueing a few and refusing the rest
+
+    At most `max_requests' requests, and at most the limit of their method
+    in `method_limits', are handled at once. Up to `queue_size' more wait up
+    to `queue_timeout' seconds for a place. New requests also wait while
+    more than `max_buffered_bytes' of bodies are held in memory. Requests
+    which are refused should get a 503 with a `Retry-After' header.
+    """
+
+    def __init__(
+        self,
+        max_requests: int = 0,
+        method_limits: str | None = None,
+        queue_size: int = 0,
+        queue_timeout: float = 1.0,
+        max_buffered_bytes: int = 0,
+    ):
+        self.max_requests = int(max_requests)
+        self.method_limits = self.parse_limits(method_limits)
+        self.queue_size = int(queue_size)
+        self.queue_timeout = float(queue_timeout)
+        self.max_buffered_bytes = int(max_buffered_bytes)
+        self.in_flight = 0
+        self.method_in_flight = collections.defaultdict(int)
+        self.buffered = 0
+        # Requests waiting for a place, as (method, future)
+        self.waiters = collections.deque()
+        self.queued = 0
+        self.rejected = 0
+
+    @staticmethod
+    def parse_limits(limits: str | None = None) -> dict:
+        """Return the limits by method from a string like "GET=100,PUT=10" """
+        method_limits = {}
+        for limit in (limits or "").split(","):
+            if not limit.strip():
+                continue
+            method, _, value = limit.partition("=")
+            value = int(value)
+            if value < 0:
+                raise ValueError(f"Invalid request limit {limit.strip()!r}")
+            method_limits[method.strip().upper()] = value
+        return method_limits
+
+    def available(self, method: str) -> bool:
+        """Return True when a request of a method may start now"""
+        if self.max_buffered_bytes and self.buffered >= self.max_buffered_bytes:
+            return False
+        if self.max_requests and self.in_flight >= self.max_requests:
+            return False
+        limit = self.method_limits.get(method)
+        return not limit or self.method_in_flight[method] < limit
+
+    def enter(self, method: str):
+        self.in_flight += 1
+        self.method_in_flight[method] += 1
+
+    async def acquire(self, method: str) -> bool:
+        """Wait for a place for a request, returning False if it is refused"""
+        if self.available(method) and not self.waiters:
+            self.enter(method)
+            return True
+        if len(self.waiters) >= self.queue_size:
+            self.rejected += 1
+            return False
+        future = asyncio.get_running_loop().create_future()
+        waiter = (method, future)
+        self.waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except TimeoutError:
+            if future.done() and not future.cancelled():
+                # A place was given just as the wait timed out
+                return True
+            # wake() may have already dropped the cancelled waiter
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self.rejected += 1
+            return False
+        return True
+
+    def release(self, method: str, buffered: int = 0):
+        """End a request, giving its place to waiting requests"""
+        self.in_flight -= 1
+        self.method_in_flight[method] -= 1
+        self.buffered -= buffered
+        self.wake()
+
+    def hold(self, size: int):
+        """Count bytes held in memory by a request"""
+        self.buffered += size
+
+    def wake(self):
+        """Start waiting requests which now have a place, oldest first"""
+        for waiter in list(self.waiters):
+            method, future = waiter
+            if future.done():
+                # The wait timed out, but the waiter has not resumed yet
+                self.waiters.remove(waiter)
+                continue
+            if not self.available(method):
+                continue
+            self.waiters.remove(waiter)
+            self.enter(method)
+            future.set_result(True)
+
+    def stats(self) -> dict:
+        """Return the requests in progress, waiting and refused"""
+        return {
+            "in_flight": self.in_flight,
+            "waiting": len(self.waiters),
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "buffered": self.buffered,
+        }
+
+
+class UpstreamPool:
+    """A process-wide HTTP client for requests to the upstream service
+
+    One client is created per IOLoop on first use, which is after any worker
+    processes are forked. The `simple' backend is `StreamingAsyncHTTPClient';
+    the `curl' backend requires pycurl, which reuses connections on its own
+    but does not apply backpressure to streamed responses, nor abandon the
+    losing request of a hedge.
+
+    See Also:
+      https://www.tornadoweb.org/en/stable/httpclient.html#tornado.httpclient.AsyncHTTPClient.configure
+    """
+
+    def __init__(
+        self,
+        backend: str = "simple",
+        max_clients: int = 10,
+        keep_alive: bool = True,
+        queue_timeout: float | None = None,
+        max_body_size: int = 5 * 1024**4,
+        metrics: Metrics = None,
+        retries: int = 0,
+        retry_backoff: float = 0.05,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_delay: float = 0,
+        router: "Router" = None,
+    ):
+        self.backend = backend
+        self.metrics = metrics
+        self.router = router
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay = hedge_delay
+        # Latency of buffered GET/HEAD requests, kept in windows of requests
+        self.latency = Histogram()
+        self.recent_latency = None
+        self.retried = 0
+        self.hedged = 0
+        self.hedges_won = 0
+        self.max_clients = max_clients
+        self.keep_alive = keep_alive
+        self.queue_timeout = queue_timeout
+        self.max_body_size = max_body_size
+        self.clients = {}
+        # Time spent waiting for a free client slot since the last report
+        self.queue_waits = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def client(self) -> tornado.httpclient.AsyncHTTPClient:
+        """Return the HTTP client for the current IOLoop"""
+        io_loop = tornado.ioloop.IOLoop.current()
+        client = self.clients.get(io_loop)
+        if client is None or client._closed:
+            client = self.clients[io_loop] = self.create_client()
+        return client
+
+    def create_client(self) -> tornado.httpclient.AsyncHTTPClient:
+        if self.backend == "curl":
+            try:
+                import tornado.curl_httpclient
+
+                return tornado.curl_httpclient.CurlAsyncHTTPClient(
+                    force_instance=True, max_clients=self.max_clients
+                )
+            except ImportError as err:
+                logger.warning(f"Using the simple HTTP client backend: {err}")
+        return StreamingAsyncHTTPClient(
+            force_instance=True,
+            max_clients=self.max_clients,
+            max_body_size=self.max_body_size,
+            keep_alive=self.keep_alive,
+            queue_timeout=self.queue_timeout,
+            on_dequeue=self.record_queue_wait,
+        )
+
+    async def fetch(self, request: tornado.httpclient.HTTPRequest, **kwargs):
+        """Make a request using the HTTP client for the current IOLoop
+
+        GET and HEAD requests which can not connect, lose their connection or
+        get a 5xx response are retried up to `retries' times after a jittered
+        exponential backoff, unless part of the response was already passed
+        to the request callbacks. When `hedge' is enabled, a second request
+        is sent for buffered GET and HEAD requests still waiting after the
+        `hedge_quantile' of recent latencies, and the first response wins.
+        """
+        if request.method not in ["GET", "HEAD"] or not (self.retries or self.hedge):
+            return await self.timed_fetch(request, **kwargs)
+        buffered = (
+            request.header_callback is None and request.streaming_callback is None
+        )
+        attempt = 0
+        while True:
+            attempt_request = self.attempt(request, retry=attempt < self.retries)
+            started = time.monotonic()
+            try:
+                if self.hedge and buffered:
+                    response = await self.hedged_fetch(attempt_request, **kwargs)
+                else:
+                    response = await self.timed_fetch(attempt_request, **kwargs)
+            except Exception as err:
+                if attempt >= self.retries or not self.retryable(err, attempt_request):
+                    raise
+            else:
+                if buffered:
+                    self.record_latency(time.monotonic() - started)
+                if attempt >= self.retries or response.code not in RETRY_STATUSES:
+                    return response
+            attempt += 1
+            self.retried += 1
+            backoff = min(1.0, self.retry_backoff * 2**attempt)
+            await asyncio.sleep(random.uniform(0, backoff))
+
+    @staticmethod
+    def attempt(
+        request: tornado.httpclient.HTTPRequest, retry: bool = False
+    ) -> tornado.httpclient.HTTPRequest:
+        """Return a copy of `request' for one attempt
+
+        When the attempt may be retried, a response with a status worth
+        retrying is held back from the request callbacks.
+        """
+        attempt = copy.copy(request)
+        attempt.cancelled = False
+        attempt.stream = None
+        attempt.delivered = False
+        attempt.held_back = False
+        header_callback = request.header_callback
+        streaming_callback = request.streaming_callback
+        if header_callback is not None:
+
+            def attempt_header_callback(line: str):
+                if retry and line.startswith("HTTP/"):
+                    attempt.held_back = int(line.split(" ", 2)[1]) in RETRY_STATUSES
+                if not attempt.held_back:
+                    attempt.delivered = True
+                    header_callback(line)
+
+            attempt.header_callback = attempt_header_callback
+        if streaming_callback is not None:
+
+            def attempt_streaming_callback(chunk: bytes):
+                if not attempt.held_back:
+                    attempt.delivered = True
+                    return streaming_callback(chunk)
+
+            attempt.streaming_callback = attempt_streaming_callback
+        return attempt
+
+    @staticmethod
+    def retryable(err: Exception, request: tornado.httpclient.HTTPRequest) -> bool:
+        """Return True when a failed attempt can be made again"""
+        if request.delivered:
+            return False
+        if isinstance(err, tornado.httpclient.HTTPClientError):
+            return err.code == 599 or err.code in RETRY_STATUSES
+        return isinstance(err, (OSError, tornado.iostream.StreamClosedError))
+
+    async def hedged_fetch(self, request: tornado.httpclient.HTTPRequest, **kwargs):
+        """Send a second request when the first is slow, returning the first"""
+        first = asyncio.ensure_future(self.timed_fetch(request, **kwargs))
+        delay = self.hedge_timeout()
+        if delay is None or self.saturated():
+            return await first
+        done, _ = await asyncio.wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        self.hedged += 1
+        hedge_request = self.attempt(request)
+        second = asyncio.ensure_future(self.timed_fetch(hedge_request, **kwargs))
+        attempts = {first: request, second: hedge_request}
+        pending = set(attempts)
+        try:
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = first if first in done else done.pop()
+                # Wait on the other request when one can not connect
+                if (
+                    pending
+                    and winner.exception() is not None
+                    and self.retryable(winner.exception(), attempts[winner])
+                ):
+                    continue
+                if winner is second:
+                    self.hedges_won += 1
+                return winner.result()
+        finally:
+            for future in pending:
+                self.abandon(attempts[future])
+                future.add_done_callback(lambda future: future.exception())
+
+    @staticmethod
+    def abandon(request: tornado.httpclient.HTTPRequest):
+        """Stop a request by closing its connection, once it has one"""
+        request.cancelled = True
+        stream = getattr(request, "stream", None)
+        if stream is not None:
+            stream.close()
+
+    def hedge_timeout(self) -> float:
+        """Return the time to wait before hedging, or None when unknown"""
+        if self.hedge_delay:
+            return self.hedge_delay
+        histogram = self.latency
+        if histogram.count < 100:
+            histogram = self.recent_latency
+        if histogram is None:
+            return None
+        return histogram.quantile(self.hedge_quantile)
+
+    def record_latency(self, seconds: float):
+        self.latency.observe(seconds)
+        if self.latency.count >= 1000:
+            self.recent_latency, self.latency = self.latency, Histogram()
+
+    def saturated(self) -> bool:
+        """Return True when requests are waiting for a free client slot"""
+        client = self.clients.get(tornado.ioloop.IOLoop.current())
+        return isinstance(client, StreamingAsyncHTTPClient) and len(client.queue) > 0
+
+    async def timed_fetch(self, request: tornado.httpclient.HTTPRequest, **kwargs):
+        """Make a request, recording its timings in `metrics' when set
+
+        The time to the first header line and to the complete response are
+        recorded, and also in the timings of the request being handled when
+        there are any.
+        """
+        timings = REQUEST_TIMINGS.get()
+        if self.metrics is None and timings is None:
+            return await self.client_fetch(request, **kwargs)
+        started = time.monotonic()
+        # For the connection to record when it is ready
+        request.timings, request.started = timings, started
+        header_callback = request.header_callback
+        first_byte = False
+
+        def timed_header_callback(line: str):
+            nonlocal first_byte
+            if not first_byte:
+                first_byte = True
+                elapsed = time.monotonic() - started
+                if self.metrics is not None:
+                    self.metrics.upstream_first_byte.observe(elapsed)
+                if timings is not None:
+                    timings.first("upstream_first_byte", elapsed)
+            if header_callback is not None:
+                header_callback(line)
+
+        request.header_callback = timed_header_callback
+        try:
+            return await self.client_fetch(request, **kwargs)
+        finally:
+            elapsed = time.monotonic() - started
+            if self.metrics is not None:
+                self.metrics.upstream_total.observe(elapsed)
+            if timings is not None:
+                timings.add("upstream", elapsed)
+
+    async def client_fetch(self, request: tornado.httpclient.HTTPRequest, **kwargs):
+        """Make a request, recording the health of its endpoint when routed"""
+        endpoint = None
+        if self.router is not None:
+            endpoint = self.router.endpoint(request.url)
+        if endpoint is None:
+            return await self.backend_fetch(request, **kwargs)
+        endpoint.outstanding += 1
+        try:
+            response = await self.backend_fetch(request, **kwargs)
+        except Exception as err:
+            # A request abandoned by a hedge says nothing about the endpoint
+            if not getattr(request, "cancelled", False):
+                self.router.record(endpoint, getattr(err, "code", 599) < 500)
+            raise
+        finally:
+            endpoint.outstanding -= 1
+        self.router.record(endpoint, response.code < 500)
+        return response
+
+    async def backend_fetch(self, request: tornado.httpclient.HTTPRequest, **kwargs):
+        client = self.client()
+        if isinstance(client, StreamingAsyncHTTPClient):
+            return await client.fetch(request, **kwargs)
+        # The curl backend reports the time spent queued with each response
+        try:
+            response = await client.fetch(request, **kwargs)
+        except tornado.httpclient.HTTPError as err:
+            if err.response is not None:
+                self.record_queue_wait(err.response.time_info.get("queue", 0))
+            raise
+        self.record_queue_wait(response.time_info.get("queue", 0))
+        return response
+
+    def record_queue_wait(self, seconds: float):
+        self.queue_waits += 1
+        self.queue_wait_total += seconds
+        self.queue_wait_max = max(self.queue_wait_max, seconds)
+
+    def stats(self) -> dict:
+        """Return the occupancy of the HTTP client for the current IOLoop"""
+        client = self.clients.get(tornado.ioloop.IOLoop.current())
+        active, queued, idle, reused = 0, 0, 0, 0
+        if isinstance(client, StreamingAsyncHTTPClient):
+            active, queued = len(client.active), len(client.queue)
+            if isinstance(client.tcp_client, KeepAliveTCPClient):
+                idle = client.tcp_client.idle_count()
+                reused = client.tcp_client.reused
+        elif client is not None:
+            active = len(client._curls) - len(client._free_list)
+            queued = len(client._requests)
+        return {
+            "backend": self.backend,
+            "max_clients": self.max_clients,
+            "active": active,
+            "queued": queued,
+            "idle": idle,
+            "reused": reused,
+            "queue_waits": self.queue_waits,
+            "queue_wait_total": self.queue_wait_total,
+            "queue_wait_max": self.queue_wait_max,
+            "retries": self.retried,
+            "hedges": self.hedged,
+            "hedges_won": self.hedges_won,
+        }
+
+    def report(self):
+        """Log the occupancy and queue wait times since the last report"""
+        stats = self.stats()
+        if stats["queue_waits"] == 0 and stats["active"] == 0:
+            return
+        logger.info(
+            "upstream pool: {active}/{max_clients} active, {queued} queued, "
+            "{idle} idle, {reused} reused; queue wait avg {avg:0.2f}ms "
+            "max {max:0.2f}ms over {count} requests; {retries} retries, "
+            "{hedges} hedges, {hedges_won} won".format(
+                avg=1000.0 * stats["queue_wait_total"] / max(1, stats["queue_waits"]),
+                max=1000.0 * stats["queue_wait_max"],
+                count=stats["queue_waits"],
+                **stats,
+            )
+        )
+        self.queue_waits = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+
+class Flight:
+    """An upstream request shared by concurrent requests for the same object
+
+    The first request (the leader) makes the upstream request and the others
+    wait on its response. Streamed responses are relayed to every request
+    which joined before the body started to arrive.
+    """
+
+    def __init__(self, handler: tornado.web.RequestHandler, on_done=None):
+        self.handlers = [handler]
+        self.future = None
+        self.on_done = on_done
+        # The upstream response as it arrives
+        self.code = None
+        self.headers = tornado.httputil.HTTPHeaders()
+        self.headers_received = False
+        self.size = 0
+        self.pending = 0
+        # Collects the body for the object cache
+        self.fill = None
+
+    def run(self, awaitable) -> asyncio.Future:
+        """Start the upstream request"""
+        self.future = asyncio.ensure_future(awaitable)
+        if self.on_done is not None:
+            self.future.add_done_callback(lambda future: self.on_done(self))
+        return self.future
+
+    async def wait(self):
+        """Return the upstream response once it is complete
+
+        The upstream request is shielded from cancellation so it continues
+        when the request waiting on it goes away.
+        """
+        return await asyncio.shield(self.future)
+
+    async def flush(self):
+        """Flush every client, dropping those which went away"""
+        handlers = list(self.handlers)
+        results = await asyncio.gather(
+            *(handler.flush() for handler in handlers), return_exceptions=True
+        )
+        for handler, result in zip(handlers, results):
+            if isinstance(result, Exception):
+                self.handlers.remove(handler)
+        if not self.handlers:
+            raise tornado.iostream.StreamClosedError()
+
+
+class SingleFlight:
+    """Share upstream requests between concurrent requests with the same key
+
+    See Also:
+      https://pkg.go.dev/golang.org/x/sync/singleflight
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.started = 0
+        self.joined = 0
+
+    def join(self, key: tuple, handler: tornado.web.RequestHandler) -> Flight:
+        """Return the flight in progress for a key, or None
+
+        A streamed response can only be joined before its body arrives.
+        """
+        flight = self.flights.get(key)
+        if flight is None or flight.size > 0:
+            return None
+        flight.handlers.append(handler)
+        self.joined += 1
+        return flight
+
+    def start(self, key: tuple, handler: tornado.web.RequestHandler) -> Flight:
+        """Return a new flight for a key led by `handler'"""
+        flight = Flight(handler, on_done=functools.partial(self.end, key))
+        self.flights[key] = flight
+        self.started += 1
+        return flight
+
+    def end(self, key: tuple, flight: Flight):
+        """Stop new requests joining a completed flight"""
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self.flights),
+            "started": self.started,
+            "joined": self.joined,
+        }
+
+
+class CacheEntry:
+    """An object body and the headers needed to serve it from a cache
+
+    Entries read from the disk cache have no `body'; it is read from `file'
+    starting at `offset' instead.
+    """
+
+    __slots__ = (
+        "body",
+        "content_encoding",
+        "content_type",
+        "etag",
+        "file",
+        "last_modified",
+        "offset",
+        "path",
+        "size",
+        "stored",
+        "variants",
+    )
+
+    def __init__(self, body: bytes, headers: dict, size: int | None = None):
+        self.body = body
+        self.size = len(body) if body is not None else size
+        self.content_type = headers.get("Content-Type", "application/octet-stream")
+        self.content_encoding = headers.get("Content-Encoding")
+        self.etag = headers.get("Etag")
+        self.last_modified = headers.get("Last-Modified")
+        # When the entry was last confirmed to match the upstream object
+        self.stored = time.time()
+        self.path = None
+        self.file = None
+        self.offset = 0
+        # Compressed copies of the body by content encoding
+        self.variants = None
+
+    def memory_size(self) -> int:
+        """Return the memory used by the body and its compressed copies"""
+        size = len(self.body) if self.body is not None else 0
+        if self.variants:
+            size += sum(len(variant) for variant in self.variants.values())
+        return size
+
+    def headers(self) -> dict:
+        """Return the headers needed to serve the entry"""
+        return {
+            header_name: header_value
+            for header_name, header_value in [
+                ("Content-Type", self.content_type),
+                ("Content-Encoding", self.content_encoding),
+                ("Etag", self.etag),
+                ("Last-Modified", self.last_modified),
+            ]
+            if header_value is not None
+        }
+
+    def reader(self):
+        """Return the file of an entry read from the disk cache, opened if closed"""
+        return self.file or open(self.path, "rb")
+
+    def close(self):
+        """Close the file of an entry read from the disk cache"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class DiskCache:
+    """Cache objects in files with a least recently used eviction policy
+
+    Each object is stored in a file named after the SHA256 of its key, with
+    a JSON line of headers followed by the body. Files are written in a
+    temporary directory and renamed into place once complete, so a partial
+    file is never served. Files whose headers can not be read, such as after
+    a crash, are removed when they are next read. The index is rebuilt at
+    startup from a directory scan alone, ordering entries by their
+    modification time, which is also when they were last confirmed to match
+    the upstream object.
+
+    Worker processes sharing a directory each keep their own index. Files
+    added by other workers are not seen until a restart, so the directory
+    may briefly grow past `max_size'.
+    """
+
+    def __init__(
+        self, directory: str, max_size: int, max_object_size: int | None = None
+    ):
+        self.directory = directory
+        self.tmp = os.path.join(directory, "tmp")
+        self.max_size = int(max_size)
+        self.max_object_size = min(int(max_object_size or max_size), self.max_size)
+        # File name -> [file size, modification time]
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        """Rebuild the index from the files in the cache directory"""
+        os.makedirs(self.tmp, exist_ok=True)
+        # Remove files left by fills which never completed; temporary files
+        # are prefixed with the PID of the worker process filling them
+        for tmp_entry in os.scandir(self.tmp):
+            if not self.filling(tmp_entry.name):
+                self.unlink(tmp_entry.path)
+        files = []
+        for dir_entry in os.scandir(self.directory):
+            if dir_entry.name == "tmp" or not dir_entry.is_dir():
+                continue
+            for file_entry in os.scandir(dir_entry.path):
+                stat = file_entry.stat()
+                files.append((stat.st_mtime, file_entry.name, stat.st_size))
+        for mtime, file_name, size in sorted(files):
+            self.entries[file_name] = [size, mtime]
+            self.size += size
+        self.evict()
+        logger.info(
+            f"disk cache: {len(self.entries)} objects, {self.size}B in {self.directory}"
+        )
+
+    @staticmethod
+    def filling(tmp_name: str) -> bool:
+        """Return True when the process filling a temporary file is running"""
+        pid = tmp_name.split("-", 1)[0]
+        if not pid.isdigit() or int(pid) == os.getpid():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def locate(self, key: str) -> tuple:
+        """Return the file name and path for a key"""
+        file_name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return file_name, os.path.join(self.directory, file_name[:2], file_name)
+
+    def __contains__(self, key: str) -> bool:
+        """Return True when a file for a key is indexed, without using it"""
+        return self.locate(key)[0] in self.entries
+
+    def get(self, key: str) -> CacheEntry:
+        """Return an entry with its file open, or None, marking it as recently used"""
+        file_name, path = self.locate(key)
+        if file_name not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            with contextlib.ExitStack() as stack:
+                file = stack.enter_context(open(path, "rb"))
+                headers = json.loads(file.readline())
+                if not isinstance(headers, dict):
+                    raise TypeError("Invalid headers")
+                if headers.pop("key", None) != key:
+                    self.misses += 1
+                    return None
+                # Keep the file open for the entry
+                stack.pop_all()
+        except FileNotFoundError:
+            self.drop(file_name)
+            self.misses += 1
+            return None
+        except (OSError, TypeError, ValueError) as err:
+            logger.warning(f"disk cache: removing {path}: {err}")
+            self.drop(file_name)
+            self.unlink(path)
+            self.misses += 1
+            return None
+        offset = file.tell()
+        entry = CacheEntry(None, headers, size=self.entries[file_name][0] - offset)
+        entry.stored = self.entries[file_name][1]
+        entry.path, entry.file, entry.offset = path, file, offset
+        self.entries.move_to_end(file_name)
+        self.hits += 1
+        return entry
+
+    def create(self, key: str, headers: dict):
+        """Return a temporary file to fill with an object body"""
+        with contextlib.ExitStack() as stack:
+            file = stack.enter_context(
+                tempfile.NamedTemporaryFile(
+                    dir=self.tmp, prefix=f"{os.getpid()}-", delete=False
+                )
+            )
+            file.write(json.dumps({"key": key, **headers}).encode("utf-8") + b"\n")
+            # Keep the file open to be filled
+            stack.pop_all()
+        return file
+
+    def commit(self, key: str, file) -> str:
+        """Move a filled temporary file into place, returning its path"""
+        file.close()
+        file_name, path = self.locate(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(file.name, path)
+        stat = os.stat(path)
+        self.drop(file_name)
+        self.entries[file_name] = [stat.st_size, stat.st_mtime]
+        self.size += stat.st_size
+        self.evict()
+        return path
+
+    def discard(self, file):
+        """Remove a temporary file which will not be committed"""
+        file.close()
+        try:
+            os.unlink(file.name)
+        except FileNotFoundError:
+            pass
+
+    def refresh(self, key: str):
+        """Mark the file for a key as confirmed to match the upstream object"""
+        file_name, path = self.locate(key)
+        if file_name not in self.entries:
+            return
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.drop(file_name)
+            return
+        self.entries[file_name][1] = time.time()
+
+    def pop(self, key: str):
+        """Remove the file for a key if there is one"""
+        file_name, path = self.locate(key)
+        if self.drop(file_name):
+            self.unlink(path)
+
+    def drop(self, file_name: str) -> bool:
+        """Remove a file from the index, returning True if it was indexed"""
+        entry = self.entries.pop(file_name, None)
+        if entry is None:
+            return False
+        self.size -= entry[0]
+        return True
+
+    def unlink(self, path: str):
+        # Open files are still readable after they are removed
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Remove the least recently used files until under the size limit"""
+        while self.size > self.max_size and self.entries:
+            file_name, (size, _) = self.entries.popitem(last=False)
+            self.size -= size
+            self.unlink(os.path.join(self.directory, file_name[:2], file_name))
+
+    def stats(self) -> dict:
+        """Return the size and hit counts of the cache"""
+        return {
+            "entries": len(self.entries),
+            "size": self.size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CacheFill:
+    """Collect an object body as it is received and add it to the cache
+
+    The body is kept in memory while it fits the memory cache and written
+    to a temporary file while it fits the disk cache.
+    """
+
+    def __init__(self, cache, key: str, headers: dict, length: int = 0):
+        self.cache = cache
+        self.key = key
+        self.headers = headers
+        self.size = 0
+        self.chunks = [] if length <= cache.memory_object_size else None
+        self.file = None
+        if cache.disk is not None and length <= cache.disk.max_object_size:
+            self.file = cache.disk.create(key, headers)
+
+    def write(self, chunk: bytes) -> bool:
+        """Add a chunk of the body, returning False once it is too large"""
+        self.size += len(chunk)
+        if self.chunks is not None:
+            if self.size > self.cache.memory_object_size:
+                self.chunks = None
+            else:
+                self.chunks.append(chunk)
+        if self.file is not None:
+            if self.size > self.cache.disk.max_object_size:
+                self.cache.disk.discard(self.file)
+                self.file = None
+            else:
+                self.file.write(chunk)
+        return self.chunks is not None or self.file is not None
+
+    def commit(self) -> CacheEntry:
+        """Add the complete body to the cache, returning the new entry"""
+        entry = None
+        self.cache.pop(self.key)
+        if self.file is not None:
+            entry = CacheEntry(None, self.headers, size=self.size)
+            entry.path = self.cache.disk.commit(self.key, self.file)
+            entry.offset = os.path.getsize(entry.path) - self.size
+            self.file = None
+        if self.chunks is not None:
+            entry = self.cache.store(self.key, b"".join(self.chunks), self.headers)
+            self.chunks = None
+        return entry
+
+    def discard(self):
+        """Drop the body without adding it to the cache"""
+        self.chunks = None
+        if self.file is not None:
+            self.cache.disk.discard(self.file)
+            self.file = None
+
+
+class ObjectCache:
+    """Cache objects in memory with a least recently used eviction policy
+
+    The total size of the cached bodies is limited to `max_size' bytes and
+    objects larger than `max_object_size' bytes are never cached. Entries
+    older than `ttl' seconds are revalidated upstream before they are used.
+
+    An optional `disk' cache is used as a second, larger tier. Objects are
+    written to both tiers and disk hits small enough for memory are moved
+    back into memory.
+
+    Expired entries are still served for `stale_while_revalidate' seconds
+    while one background request per key revalidates them, and for
+    `stale_if_error' seconds when the upstream request fails.
+
+    See Also:
+      https://www.rfc-editor.org/rfc/rfc5861
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        max_object_size: int = 1024**2,
+        ttl: float = 60,
+        disk: DiskCache = None,
+        stale_while_revalidate: float = 0,
+        stale_if_error: float = 0,
+    ):
+        self.max_size = int(max_size)
+        self.memory_object_size = min(int(max_object_size), self.max_size)
+        self.ttl = float(ttl)
+        self.stale_while_revalidate = float(stale_while_revalidate)
+        self.stale_if_error = float(stale_if_error)
+        self.disk = disk
+        self.entries = collections.OrderedDict()
+        # Keys with a background revalidation in flight
+        self.revalidating = set()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale = 0
+
+    @property
+    def max_object_size(self) -> int:
+        """Return the size of the largest object which may be cached"""
+        if self.disk is not None:
+            return max(self.memory_object_size, self.disk.max_object_size)
+        return self.memory_object_size
+
+    def __contains__(self, key: str) -> bool:
+        """Return True when either tier has an entry for a key, without using it"""
+        return key in self.entries or (self.disk is not None and key in self.disk)
+
+    def get(self, key: str) -> CacheEntry:
+        """Return the entry for a key, or None, marking it as recently used"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        elif self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None and entry.size <= self.memory_object_size:
+                # Move small objects back into memory
+                body = entry.file.read(entry.size)
+                entry.close()
+                stored = entry.stored
+                entry = self.store(key, body, entry.headers())
+                entry.stored = stored
+        if entry is None or not self.fresh(entry):
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def fresh(self, entry: CacheEntry) -> bool:
+        """Return True when an entry may be used without revalidation"""
+        return self.age(entry) < self.ttl
+
+    @staticmethod
+    def age(entry: CacheEntry) -> float:
+        """Return the seconds since an entry was confirmed upstream"""
+        return max(0.0, time.time() - entry.stored)
+
+    def usable_stale(self, entry: CacheEntry, window: float) -> bool:
+        """Return True when an expired entry is within a stale `window'"""
+        return entry is not None and self.age(entry) < self.ttl + window
+
+    def cache_control(self) -> str:
+        """Return the `Cache-Control' header sent with cached objects"""
+        directives = [f"max-age={int(self.ttl)}"]
+        if self.stale_while_revalidate > 0:
+            directives.append(
+                f"stale-while-revalidate={int(self.stale_while_revalidate)}"
+            )
+        if self.stale_if_error > 0:
+            directives.append(f"stale-if-error={int(self.stale_if_error)}")
+        return ", ".join(directives)
+
+    def refresh(self, key: str, entry: CacheEntry):
+        """Mark an entry as confirmed to match the upstream object"""
+        entry.stored = time.time()
+        self.revalidated += 1
+        if self.disk is not None:
+            self.disk.refresh(key)
+
+    def fill(self, key: str, headers: dict) -> CacheFill:
+        """Return a fill for an object body, or None if it is too large"""
+        length = int(headers.get("Content-Length") or 0)
+        if length > self.max_object_size:
+            return None
+        return CacheFill(self, key, self.cached_headers(headers), length)
+
+    def put(self, key: str, body: bytes, headers: dict) -> CacheEntry:
+        """Cache an object body, returning the new entry or None if too large"""
+        fill = self.fill(key, headers)
+        if fill is None or not fill.write(body):
+            self.pop(key)
+            return None
+        return fill.commit()
+
+    def store(self, key: str, body: bytes, headers: dict) -> CacheEntry:
+        """Add an object body to the memory cache"""
+        self.pop_memory(key)
+        entry = CacheEntry(body, headers)
+        self.entries[key] = entry
+        self.size += len(body)
+        self.evict()
+        return entry
+
+    def add_variant(self, key: str, entry: CacheEntry, encoding: str, body: bytes):
+        """Keep a compressed copy of the body of an entry in memory"""
+        if self.entries.get(key) is not entry:
+            # The entry was replaced or evicted while it was compressed
+            return
+        entry.variants = dict(entry.variants or {}, **{encoding: body})
+        self.size += len(body)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until within `max_size'"""
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.memory_size()
+
+    @staticmethod
+    def cached_headers(headers: dict) -> dict:
+        """Return the response headers kept with a cached object"""
+        return {
+            header_name: headers.get(header_name)
+            for header_name in [
+                "Content-Type",
+                "Content-Encoding",
+                "Etag",
+                "Last-Modified",
+            ]
+            if headers.get(header_name) is not None
+        }
+
+    def pop(self, key: str):
+        """Remove the entry for a key if there is one"""
+        self.pop_memory(key)
+        if self.disk is not None:
+            self.disk.pop(key)
+
+    def pop_memory(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.memory_size()
+
+    def stats(self) -> dict:
+        """Return the size and hit counts of the cache"""
+        stats = {
+            "entries": len(self.entries),
+            "size": self.size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "stale": self.stale,
+        }
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+class ResponseCompressor:
+    """Compress cached objects once for each content encoding
+
+    Objects of compressible types are compressed with the first of
+    `encodings' the client accepts and the result is kept with the object
+    cache entry, so later responses reuse it. Bodies of at least
+    `thread_size' bytes are compressed in a thread pool to keep the IOLoop
+    responsive. The `br' and `zstd' encodings are used when the `brotli' and
+    `zstandard' packages are installed.
+
+    See Also:
+      https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Accept-Encoding
+    """
+
+    CONTENT_TYPES = tornado.web.GZipContentEncoding.CONTENT_TYPES
+    MIN_LENGTH = tornado.web.GZipContentEncoding.MIN_LENGTH
+
+    def __init__(self, encodings: tuple = ("br", "zstd", "gzip"), thread_size=65536):
+        self.thread_size = int(thread_size)
+        self.compressors = {}
+        for encoding in encodings:
+            compressor = self.load(encoding)
+            if compressor is not None:
+                self.compressors[encoding] = compressor
+        # Compressions in progress by cache key, Etag and encoding
+        self.pending = {}
+        self.compressed = 0
+
+    @staticmethod
+    def load(encoding: str):
+        """Return a function compressing bytes with an encoding, or None"""
+        try:
+            if encoding == "gzip":
+                return functools.partial(
+                    gzip.compress,
+                    compresslevel=tornado.web.GZipContentEncoding.GZIP_LEVEL,
+                    mtime=0,
+                )
+            if encoding == "br":
+                import brotli
+
+                return functools.partial(brotli.compress, quality=5)
+            if encoding == "zstd":
+                import zstandard
+
+                # Compressor objects are not thread-safe; use one per body
+                return lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+        except ImportError as err:
+            logger.info(f"Not compressing responses with {encoding}: {err}")
+            return None
+        logger.warning(f"Not compressing responses with unknown {encoding!r}")
+        return None
+
+    def negotiate(self, entry: CacheEntry, accept_encoding: str) -> str:
+        """Return the encoding to compress a cached object with, or None"""
+        if (
+            entry.body is None
+            or entry.content_encoding is not None
+            or len(entry.body) < self.MIN_LENGTH
+        ):
+            return None
+        content_type = entry.content_type.split(";")[0].strip()
+        if not (content_type.startswith("text/") or content_type in self.CONTENT_TYPES):
+            return None
+        accepted = {}
+        for coding in (accept_encoding or "").split(","):
+            coding, _, params = coding.partition(";")
+            quality = 1.0
+            params = params.strip().replace(" ", "")
+            if params.startswith("q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[coding.strip().lower()] = quality
+        for encoding in self.compressors:
+            if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+        return None
+
+    async def compress(
+        self, cache: ObjectCache, key: str, entry: CacheEntry, encoding: str
+    ) -> bytes:
+        """Return the body of an entry compressed, compressing it only once"""
+        if entry.variants and encoding in entry.variants:
+            return entry.variants[encoding]
+        pending_key = (key, entry.etag, encoding)
+        future = self.pending.get(pending_key)
+        if future is not None:
+            return await future
+        compressor = self.compressors[encoding]
+        if len(entry.body) < self.thread_size:
+            body = compressor(entry.body)
+        else:
+            future = self.pending[pending_key] = (
+                tornado.ioloop.IOLoop.current().run_in_executor(
+                    None, compressor, entry.body
+                )
+            )
+            try:
+                body = await future
+            finally:
+                del self.pending[pending_key]
+        self.compressed += 1
+        cache.add_variant(key, entry, encoding, body)
+        return body
+
+
+class NegativeCache:
+    """Remember objects which upstream reported as missing or forbidden
+
+    The status of up to `max_size' keys is kept for `ttl' seconds, so
+    repeated requests for them are answered without signing a request or
+    waiting on upstream. The oldest keys are evicted first.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 10):
+        self.max_size = int(max_size)
+        self.ttl = float(ttl)
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+
+    def __contains__(self, key: str) -> bool:
+        """Return True when the status of a key is remembered, without a hit"""
+        item = self.entries.get(key)
+        return item is not None and time.monotonic() < item[1]
+
+    def get(self, key: str) -> int:
+        """Return the status remembered for a key, or None"""
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        code, expires = item
+        if time.monotonic() >= expires:
+            del self.entries[key]
+            return None
+        self.hits += 1
+        return code
+
+    def put(self, key: str, code: int):
+        """Remember the status of a key for `ttl' seconds"""
+        self.entries.pop(key, None)
+        self.entries[key] = (code, time.monotonic() + self.ttl)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: str):
+        """Forget the status of a key if there is one"""
+        self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        """Return the size and hit count of the cache"""
+        return {
+            "entries": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+        }
+
+
+class ObjectMetadata:
+    """The size and headers of an object, as returned by a HEAD request"""
+
+    __slots__ = (
+        "content_encoding",
+        "content_type",
+        "etag",
+        "last_modified",
+        "size",
+        "stored",
+    )
+
+    def __init__(
+        self,
+        size: int,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        content_type: str | None = None,
+        content_encoding: str | None = None,
+    ):
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        # Few distinct values are shared by many objects
+        self.content_type = sys.intern(content_type or "application/octet-stream")
+        self.content_encoding = (
+            sys.intern(content_encoding) if content_encoding else None
+        )
+        self.stored = time.time()
+
+    def headers(self) -> dict:
+        """Return the headers of a response for the object"""
+        return {
+            header_name: header_value
+            for header_name, header_value in [
+                ("Content-Type", self.content_type),
+                ("Content-Encoding", self.content_encoding),
+                ("Etag", self.etag),
+                ("Last-Modified", self.last_modified),
+            ]
+            if header_value is not None
+        }
+
+
+class MetadataIndex:
+    """Index the metadata of objects to answer HEAD requests locally
+
+    Up to `max_size' objects are indexed, least recently used first evicted,
+    from upstream GET and HEAD responses or a bucket listing. Entries older
+    than `ttl' seconds are not used; the next upstream response replaces them.
+    """
+
+    def __init__(self, max_size: int = 1000000, ttl: float = 60):
+        self.max_size = int(max_size)
+        self.ttl = float(ttl)
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+
+    def get(self, key: str) -> ObjectMetadata:
+        """Return the current metadata of an object, or None"""
+        metadata = self.entries.get(key)
+        if metadata is None:
+            return None
+        if time.time() - metadata.stored >= self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return metadata
+
+    def put(self, key: str, metadata: ObjectMetadata):
+        """Index the metadata of an object"""
+        self.entries.pop(key, None)
+        self.entries[key] = metadata
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def update(self, key: str, code: int, headers: tornado.httputil.HTTPHeaders):
+        """Index or drop an object from the response to a GET or HEAD of it
+
+        Only complete responses with a `Content-Length' give the object size.
+        """
+        if code in [404, 410]:
+            self.pop(key)
+        if code != 200 or headers.get("Content-Length") is None:
+            return
+        self.put(
+            key,
+            ObjectMetadata(
+                size=int(headers.get("Content-Length")),
+                etag=headers.get("Etag"),
+                last_modified=headers.get("Last-Modified"),
+                content_type=headers.get("Content-Type"),
+                # Set when the HTTP client decompressed the body
+                content_encoding=headers.get("Content-Encoding")
+                or headers.get("X-Consumed-Content-Encoding"),
+            ),
+        )
+
+    def pop(self, key: str):
+        """Drop an object from the index if it is there"""
+        self.entries.pop(key, None)
+
+    async def preload(self, router: "Router", upstream: "UpstreamPool"):
+        """Index every object listed in the bucket of each backend
+
+        Listings have no `Content-Type', so it is guessed from the key as it
+        is for uploads through the proxy. Loading stops once the index is
+        full.
+        """
+        name = "MetadataIndex.preload"
+        for backend in router.backends:
+            query = {"list-type": "2", "encoding-type": "url"}
+            indexed = len(self.entries)
+            while len(self.entries) < self.max_size:
+                parser = ListObjectsParser()
+                request_url, request_headers = backend.choose().sign(
+                    "GET", "/", query=query
+                )
+                try:
+                    await upstream.fetch(
+                        tornado.httpclient.HTTPRequest(
+                            request_url,
+                            headers=request_headers,
+                            streaming_callback=functools.partial(
+                                self.index_listing, backend.key_prefix, parser
+                            ),
+                        )
+                    )
+                except (
+                    tornado.httpclient.HTTPError,
+                    OSError,
+                    xml.etree.ElementTree.ParseError,
+                ) as err:
+                    logger.warning("%s - GET %s: %s", name, request_url, err)
+                    break
+                if not parser.truncated or not parser.next_token:
+                    break
+                query["continuation-token"] = parser.next_token
+            logger.info(
+                "%s - indexed %s objects of backend %s",
+                name,
+                len(self.entries) - indexed,
+                backend.name,
+            )
+
+    def index_listing(self, key_prefix: str, parser: "ListObjectsParser", chunk: bytes):
+        """Index the objects listed in a chunk of a ListObjectsV2 response"""
+        for item in parser.feed(chunk):
+            if "key" not in item or len(self.entries) >= self.max_size:
+                continue
+            last_modified = None
+            if item["last_modified"]:
+                last_modified = formatdate(
+                    calendar.timegm(
+                        time.strptime(item["last_modified"][:19], "%Y-%m-%dT%H:%M:%S")
+                    ),
+                    usegmt=True,
+                )
+            self.put(
+                f"{key_prefix}/{item['key']}",
+                ObjectMetadata(
+                    size=item["size"],
+                    etag=item["etag"],
+                    last_modified=last_modified,
+                    content_type=guess_type(item["key"])[0],
+                ),
+            )
+
+    def stats(self) -> dict:
+        """Return the size and hit count of the index"""
+        return {
+            "entries": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+        }
+
+
+class AWSv4Signer:
+    """Sign requests with a AWSv4 signature
+
+    A signer is created once per application. The signing key only changes
+    once per UTC day so it is derived on the first request of a day and
+    cached, along with the credential scope and the static parts of the
+    canonical request and authorization header. Signing a request then costs
+    one SHA256 of the canonical request and one HMAC of the string to sign.
+
+    See Also:
+      https://docs.aws.amazon.com/IAM/latest/UserGuide/create-signed-request.html
+    """
+
+    algorithm = "AWS4-HMAC-SHA256"
+    # This should match the header names used in the default canonical headers
+    signed_headers = "host;x-amz-content-sha256;x-amz-date"
+
+    def __init__(
+        self,
+        access_key: str,
+        secret_key: str,
+        endpoint: str,
+        bucket: str,
+        region: str,
+        service: str,
+        scheme: str = "https",
+        debug: bool = False,
+    ):
+        self.access_key = str(access_key)
+        self.secret_key = str(secret_key)
+        self.endpoint = endpoint
+        self.region = region
+        self.service = service
+        self.debug = debug
+        self.path_prefix = f"/{bucket}"
+        self.url_prefix = f"{scheme}://{endpoint}/{bucket}"
+        self.host_header = f"host:{endpoint}\n"
+        # The x-amz-date value is cached for the current second
+        self.second = None
+        self.amzdate = None
+        # The signing key and credential scope are cached for the current day
+        self.date = None
+        self.signing_key = None
+        self.credential_scope = None
+        self.authorization_prefix = None
+
+    @staticmethod
+    def _sign(key: bytes, msg: str) -> bytes:
+        """Return a new HMAC SHA256 digest"""
+        return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+    @classmethod
+    def derive_key(cls, secret_key: str, date: str, region: str, service: str) -> bytes:
+        """Return a AWSv4 signing key"""
+        w_date = cls._sign(("AWS4" + secret_key).encode("utf-8"), date)
+        w_region = cls._sign(w_date, region)
+        w_service = cls._sign(w_region, service)
+        return cls._sign(w_service, "aws4_request")
+
+    def timestamp(self) -> str:
+        """Return the current time in the x-amz-date format"""
+        now = int(time.time())
+        if now != self.second:
+            self.amzdate = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(now))
+            self.second = now
+        return self.amzdate
+
+    def scope(self, date: str) -> tuple:
+        """Return the signing key and credential scope for a date (YYYYMMDD)"""
+        if date != self.date:
+            self.signing_key = self.derive_key(
+                self.secret_key, date, self.region, self.service
+            )
+            self.credential_scope = f"{date}/{self.region}/{self.service}/aws4_request"
+            self.authorization_prefix = (
+                f"{self.algorithm} Credential={self.access_key}/"
+                f"{self.credential_scope}, SignedHeaders="
+            )
+            self.date = date
+        return self.signing_key, self.credential_scope
+
+    @staticmethod
+    def canonical_query(query: dict) -> str:
+        """Return query parameters URI encoded and sorted by name"""
+        return "&".join(
+            sorted(
+                f"{quote(str(key), safe='~')}={quote(str(value), safe='~')}"
+                for key, value in query.items()
+            )
+        )
+
+    def sign(
+        self,
+        method: str,
+        path: str,
+        payload_hash: str = EMPTY_PAYLOAD,
+        headers: dict | None = None,
+        query: dict | None = None,
+    ) -> tuple:
+        """Return the URL and signed headers for a request of an object path
+
+        Any additional `headers' which are sent upstream are also signed.
+        """
+        amzdate = self.timestamp()
+        signing_key, credential_scope = self.scope(amzdate[:8])
+        canonical_query_string = self.canonical_query(query) if query else ""
+
+        if headers:
+            # Canonical headers are sorted by their lowercase names
+            canonical_header_values = {
+                "host": self.endpoint,
+                "x-amz-content-sha256": payload_hash,
+                "x-amz-date": amzdate,
+            }
+            for header_name, header_value in headers.items():
+                canonical_header_values[header_name.lower()] = str(header_value).strip()
+            signed_headers = ";".join(sorted(canonical_header_values))
+            canonical_headers = "".join(
+                f"{header_name}:{canonical_header_values[header_name]}\n"
+                for header_name in sorted(canonical_header_values)
+            )
+        else:
+            signed_headers = self.signed_headers
+            canonical_headers = (
+                f"{self.host_header}"
+                f"x-amz-content-sha256:{payload_hash}\n"
+                f"x-amz-date:{amzdate}\n"
+            )
+
+        canonical_request = (
+            f"{method}\n{self.path_prefix}{path}\n{canonical_query_string}\n"
+            f"{canonical_headers}\n{signed_headers}\n{payload_hash}"
+        )
+        string_to_sign = (
+            f"{self.algorithm}\n{amzdate}\n{credential_scope}\n"
+            f"{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
+        )
+        signature = hmac.new(
+            signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+        if self.debug:
+            logger.debug("canonical_request:\n%s", canonical_request)
+            logger.debug("string_to_sign:\n%s", string_to_sign)
+
+        request_headers = {
+            "x-amz-date": amzdate,
+            "x-amz-content-sha256": payload_hash,
+            "Authorization": (
+                f"{self.authorization_prefix}{signed_headers},Signature={signature}"
+            ),
+        }
+        if headers:
+            request_headers.update(headers)
+        request_url = f"{self.url_prefix}{path}"
+        if canonical_query_string:
+            request_url = f"{request_url}?{canonical_query_string}"
+        return request_url, request_headers
+
+    def presign(self, method: str, path: str, expires: int = 3600) -> str:
+        """Return a URL for a request of an object path signed in its query
+
+        The URL is valid for `expires' seconds and can be used by clients
+        without any signed headers.
+
+        See Also:
+          https://docs.aws.amazon.com/AmazonS3/latest/API/sigv4-query-string-auth.html
+        """
+        amzdate = self.timestamp()
+        signing_key, credential_scope = self.scope(amzdate[:8])
+        canonical_query_string = self.canonical_query(
+            {
+                "X-Amz-Algorithm": self.algorithm,
+                "X-Amz-Credential": f"{self.access_key}/{credential_scope}",
+                "X-Amz-Date": amzdate,
+                "X-Amz-Expires": int(expires),
+                "X-Amz-SignedHeaders": "host",
+            }
+        )
+        canonical_request = (
+            f"{method}\n{self.path_prefix}{path}\n{canonical_query_string}\n"
+            f"{self.host_header}\nhost\n{UNSIGNED_PAYLOAD}"
+        )
+        string_to_sign = (
+            f"{self.algorithm}\n{amzdate}\n{credential_scope}\n"
+            f"{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
+        )
+        signature = hmac.new(
+            signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+        return (
+            f"{self.url_prefix}{path}?{canonical_query_string}"
+            f"&X-Amz-Signature={signature}"
+        )
+
+
+class AWSv4ChunkSigner:
+    """Sign the chunks of a STREAMING-AWS4-HMAC-SHA256-PAYLOAD request body
+
+    Every chunk is signed using the signature of the previous chunk, starting
+    with the signature of the request headers (the seed signature).
+
+    See Also:
+      https://docs.aws.amazon.com/AmazonS3/latest/API/sigv4-streaming.html
+    """
+
+    def __init__(
+        self,
+        signing_key: bytes,
+        amzdate: str,
+        credential_scope: str,
+        seed_signature: str,
+    ):
+        self.signing_key = signing_key
+        self.prefix = f"AWS4-HMAC-SHA256-PAYLOAD\n{amzdate}\n{credential_scope}\n"
+        self.signature = seed_signature
+
+    def sign(self, chunk: bytes) -> bytes:
+        """Return a chunk framed with its signature in aws-chunked encoding"""
+        string_to_sign = "\n".join(
+            [
+                self.prefix + self.signature,
+                EMPTY_PAYLOAD,
+                hashlib.sha256(chunk).hexdigest(),
+            ]
+        )
+        self.signature = hmac.new(
+            self.signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+        return b"".join(
+            [
+                f"{len(chunk):x};chunk-signature={self.signature}\r\n".encode(),
+                chunk,
+                b"\r\n",
+            ]
+        )
+
+    @staticmethod
+    def encoded_length(size: int, chunk_size: int) -> int:
+        """Return the length of a body of `size' bytes in aws-chunked encoding"""
+
+        def framed(length: int) -> int:
+            # hex(length);chunk-signature=<64 hex digits>\r\n<data>\r\n
+            return len(f"{length:x}") + 17 + 64 + 2 + length + 2
+
+        full_chunks, remainder = divmod(size, chunk_size)
+        length = full_chunks * framed(chunk_size) + framed(0)
+        if remainder:
+            length += framed(remainder)
+        return length
+
+
+class ListObjectsParser:
+    """Parse a ListObjectsV2 response body incrementally as it arrives
+
+    Objects and common prefixes are returned by `feed' as soon as they are
+    complete and are then dropped from the parsed document, so the memory
+    used does not grow with the number of keys. Keys are expected to be URL
+    encoded, as requested with `encoding-type=url'.
+
+    See Also:
+      https://docs.aws.amazon.com/AmazonS3/latest/API/API_ListObjectsV2.html
+    """
+
+    def __init__(self):
+        self.parser = xml.etree.ElementTree.XMLPullParser(events=("start", "end"))
+        self.root = None
+        self.truncated = False
+        self.next_token = None
+
+    @staticmethod
+    def fields(element: xml.etree.ElementTree.Element) -> dict:
+        """Return the text of the children of an element by tag name"""
+        return {child.tag.rsplit("}", 1)[-1]: child.text for child in element}
+
+    def feed(self, chunk: bytes) -> list:
+        """Parse part of the body, returning the objects and prefixes completed"""
+        self.parser.feed(chunk)
+        items = []
+        for event, element in self.parser.read_events():
+            if self.root is None:
+                self.root = element
+                continue
+            if event != "end":
+                continue
+            tag = element.tag.rsplit("}", 1)[-1]
+            if tag == "IsTruncated":
+                self.truncated = element.text == "true"
+            elif tag == "NextContinuationToken":
+                self.next_token = element.text
+            elif tag == "Contents":
+                fields = self.fields(element)
+                items.append(
+                    {
+                        "key": unquote_plus(fields.get("Key") or ""),
+                        "size": int(fields.get("Size") or 0),
+                        "etag": fields.get("ETag"),
+                        "last_modified": fields.get("LastModified"),
+                        "storage_class": fields.get("StorageClass"),
+                    }
+                )
+                self.root.clear()
+            elif tag == "CommonPrefixes":
+                fields = self.fields(element)
+                items.append({"prefix": unquote_plus(fields.get("Prefix") or "")})
+                self.root.clear()
+        return items
+
+
+class Endpoint:
+    """One address of an object storage service and its health
+
+    An endpoint is ejected for `eject_time' seconds after `eject_failures'
+    consecutive failed upstream requests, and is back as soon as a request
+    or probe succeeds.
+    """
+
+    __slots__ = ("address", "ejected_until", "failures", "outstanding", "signer")
+
+    def __init__(self, address: str, signer: "AWSv4Signer"):
+        self.address = address
+        # A signer for probe requests
+        self.signer = signer
+        # Upstream requests in progress
+        self.outstanding = 0
+        # Consecutive failed upstream requests
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def ejected(self, now: float | None = None) -> bool:
+        return self.ejected_until > (time.monotonic() if now is None else now)
+
+
+class Backend:
+    """A bucket, its credentials and the endpoints serving it
+
+    Requests are routed here by the request `host' or a path `prefix', which
+    is removed from the object path when `strip_prefix' is set. Each request
+    is signed for the healthy endpoint with the fewest outstanding upstream
+    requests, or any endpoint when all of them are ejected.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        bucket: str,
+        endpoints: list,
+        access_key: str,
+        secret_key: str,
+        region: str,
+        service: str,
+        scheme: str = "https",
+        prefix: str | None = None,
+        host: str | None = None,
+        strip_prefix: bool = False,
+        debug: bool = False,
+    ):
+        self.name = name
+        self.bucket = bucket
+        self.prefix = prefix
+        self.host = host.lower() if host else None
+        self.strip_prefix = strip_prefix
+        # Cache keys of the default backend are the bucket and path alone
+        self.key_prefix = bucket if name == "default" else f"{name}:{bucket}"
+        self.endpoints = [Endpoint(address, None) for address in endpoints]
+        self.signers = [
+            AWSv4Signer(
+                access_key=access_key,
+                secret_key=secret_key,
+                endpoint=endpoint.address,
+                bucket=bucket,
+                region=region,
+                service=service,
+                scheme=scheme,
+                debug=debug,
+            )
+            for endpoint in self.endpoints
+        ]
+
+    def choose(self) -> AWSv4Signer:
+        """Return the signer of the endpoint to send a request to"""
+        if len(self.endpoints) == 1:
+            return self.signers[0]
+        now = time.monotonic()
+        candidates = [
+            index
+            for index, endpoint in enumerate(self.endpoints)
+            if not endpoint.ejected(now)
+        ] or range(len(self.endpoints))
+        fewest = min(self.endpoints[index].outstanding for index in candidates)
+        return self.signers[
+            random.choice(
+                [
+                    index
+                    for index in candidates
+                    if self.endpoints[index].outstanding == fewest
+                ]
+            )
+        ]
+
+    def circuit_open(self) -> float:
+        """Return the seconds until an endpoint is back when all are ejected
+
+        Returns 0 while any endpoint is in service.
+        """
+        now = time.monotonic()
+        return max(
+            0.0, min(endpoint.ejected_until for endpoint in self.endpoints) - now
+        )
+
+    def object_path(self, path: str) -> str:
+        """Return the object path of a request path"""
+        if self.strip_prefix and self.prefix:
+            return "/" + path[len(self.prefix) :].lstrip("/")
+        return path
+
+
+class Router:
+    """Route requests to backends by Host header, then path prefix
+
+    Requests which match no backend use the `default' backend. Endpoints
+    shared by several backends share their health.
+    """
+
+    def __init__(
+        self,
+        default: Backend,
+        backends: list | None = None,
+        eject_failures: int = 5,
+        eject_time: float = 30.0,
+    ):
+        self.default = default
+        self.backends = [default] + list(backends or [])
+        self.eject_failures = eject_failures
+        self.eject_time = eject_time
+        self.hosts = {
+            backend.host: backend for backend in self.backends if backend.host
+        }
+        # The longest matching prefix wins
+        self.prefixes = sorted(
+            (backend for backend in self.backends if backend.prefix),
+            key=lambda backend: len(backend.prefix),
+            reverse=True,
+        )
+        self.endpoints = {}
+        for backend in self.backends:
+            for index, endpoint in enumerate(backend.endpoints):
+                shared = self.endpoints.setdefault(endpoint.address, endpoint)
+                shared.signer = shared.signer or backend.signers[index]
+                backend.endpoints[index] = shared
+
+    def route(self, host: str, path: str) -> tuple:
+        """Return the backend and object path for a request"""
+        if self.hosts:
+            hostname = tornado.httputil.split_host_and_port(host.lower())[0]
+            backend = self.hosts.get(hostname)
+            if backend is not None:
+                return backend, backend.object_path(path)
+        for backend in self.prefixes:
+            if path.startswith(backend.prefix):
+                return backend, backend.object_path(path)
+        return self.default, path
+
+    def endpoint(self, url: str) -> Endpoint:
+        """Return the endpoint of an upstream request URL"""
+        return self.endpoints.get(url.split("/", 3)[2])
+
+    def record(self, endpoint: Endpoint, ok: bool):
+        """Record the outcome of an upstream request to an endpoint"""
+        if ok:
+            if endpoint.failures >= self.eject_failures:
+                logger.info(f"Endpoint {endpoint.address} is back in service")
+            endpoint.failures = 0
+            endpoint.ejected_until = 0.0
+            return
+        endpoint.failures += 1
+        if endpoint.failures >= self.eject_failures:
+            if not endpoint.ejected():
+                logger.warning(
+                    f"Endpoint {endpoint.address} ejected after "
+                    f"{endpoint.failures} consecutive failures"
+                )
+            endpoint.ejected_until = time.monotonic() + self.eject_time
+
+    async def probe(self, upstream: "UpstreamPool"):
+        """Send a HEAD request for its bucket to each ejected endpoint"""
+        for endpoint in self.endpoints.values():
+            if not endpoint.ejected():
+                continue
+            request_url, request_headers = endpoint.signer.sign("HEAD", "/")
+            try:
+                await upstream.client_fetch(
+                    tornado.httpclient.HTTPRequest(
+                        request_url,
+                        method="HEAD",
+                        headers=request_headers,
+                        connect_timeout=5,
+                        request_timeout=5,
+                    ),
+                    raise_error=False,
+                )
+            except (tornado.httpclient.HTTPError, OSError) as err:
+                logger.debug(f"Probe of endpoint {endpoint.address} failed: {err}")
+
+
+@tornado.web.stream_request_body
+class AWSv4Handler(tornado.web.RequestHandler):
+    """Handle making HTTP requests using the AWSv4 signature
+
+    See Also:
+      https://www.tornadoweb.org/en/stable/web.html
+      https://docs.aws.amazon.com/general/latest/gr/sigv4-signed-request-examples.html
+    """
+
+    def initialize(self, **kwargs):
+        name = "AWSv4Handler.initialize"
+        logger.debug("%s - **kwargs: %r", name, kwargs)
+        # Request body chunks waiting to be forwarded upstream
+        self.body_queue = None
+        # The upstream request started for a streamed upload
+        self.upload = None
+        # The object cache entry used for the response
+        self.cache_entry = None
+        # When the request started being counted as in flight
+        self.started = None
+        # When the response started being written to the client
+        self.write_started = None
+        # Response bytes written to the client
+        self.bytes_sent = 0
+        # The body of a batch signing request
+        self.post_body = None
+        # The backend, object path and signer the request is routed to
+        self.backend = None
+        self.object_path = None
+        self.signer = None
+        # If the request holds a place with the admission control
+        self.admitted = False
+        # Body bytes held in memory, counted by the admission control
+        self.buffered = 0
+        # Phase timings for the `Server-Timing' header
+        self.timings = None
+        # If the request was forwarded upstream
+        self.forwarded = False
+        # The `X-Cache' header of the response, for the access log
+        self.cache_status = None
+
+    async def prepare(self):
+        """Admit the request and start forwarding an upload before its body arrives
+
+        Requests are refused with a 503 when the admission control has no
+        place for them, or when the circuit breaker is open because every
+        endpoint of their backend is failing.
+
+        See Also:
+          https://www.tornadoweb.org/en/stable/web.html#tornado.web.stream_request_body
+        """
+        name = "AWSv4Handler.prepare"
+        metrics = self.settings.get("metrics")
+        if metrics is not None:
+            metrics.in_flight += 1
+            self.started = time.monotonic()
+        if self.settings.get("server_timing", False):
+            self.timings = RequestTimings()
+            REQUEST_TIMINGS.set(self.timings)
+
+        self.backend, self.object_path = self.settings["router"].route(
+            self.request.host, self.request.path
+        )
+        self.signer = self.backend.choose()
+
+        # Health checks, metrics and profiles are always answered; a profile
+        # would otherwise hold a place for as long as it runs
+        exempt = (
+            self.request.path.endswith("/ping")
+            or self.request.path == "/metrics"
+            or (self.request.path == "/_profile" and self.settings.get("admin", False))
+        )
+        if not exempt:
+            # Fail fast while upstream is failing; auth-only requests never
+            # reach it
+            if self.settings.get("circuit_breaker", False) and not (
+                self.settings.get("auth_only", False)
+                or self.request.headers.get("X-Auth-Only", False)
+            ):
+                retry_after = self.backend.circuit_open()
+                if retry_after > 0:
+                    self.reject("circuit_open", retry_after)
+                    return
+            admission = self.settings.get("admission")
+            if admission is not None:
+                if not await admission.acquire(self.method_label()):
+                    self.reject("overload", admission.queue_timeout)
+                    return
+                self.admitted = True
+
+        # Batch signing requests are small and read in full
+        if self.request.method == "POST":
+            self.post_body = []
+            self.request.connection.set_max_body_size(
+                1024 * int(self.settings.get("sign_batch_size", 1000))
+            )
+            return
+
+        if self.request.method != "PUT" or not self.settings.get("admin", False):
+            return
+        if self.request.path.endswith("/ping"):
+            return
+        # Auth-only requests are never forwarded upstream
+        if self.settings.get("auth_only", False) or self.request.headers.get(
+            "X-Auth-Only", False
+        ):
+            return
+
+        # Object storage services require the size of an upload up front
+        if self.request.headers.get("Content-Length") is None:
+            self.set_status(411)
+            self.set_header("Cache-Control", "private, no-store")
+            self.set_header("Content-Type", "text/plain")
+            self.finish()
+            return
+
+        self.request.connection.set_max_body_size(
+            int(self.settings.get("max_body_size", 5 * 1024**4))
+        )
+        self.body_queue = tornado.queues.Queue(maxsize=4)
+        self.upload = asyncio.ensure_future(self.fetch(**self.path_kwargs))
+        self.upload.add_done_callback(lambda future: self.drain_body_queue())
+        logger.debug("%s - upload: %r", name, self.upload)
+
+    def reject(self, reason: str, retry_after: float):
+        """Refuse the request with a 503 and when to retry"""
+        logger.warning(
+            "Refused %s %s: %s", self.request.method, self.request.path, reason
+        )
+        if self.settings.get("metrics") is not None:
+            self.settings["metrics"].rejected[reason] += 1
+        self.set_status(503)
+        self.set_header("Retry-After", max(1, math.ceil(retry_after)))
+        self.set_header("Cache-Control", "private, no-store")
+        self.set_header("Content-Type", "text/plain")
+        self.finish("Service Unavailable\n")
+
+    def hold_buffered(self, size: int):
+        """Count body bytes held in memory for the request"""
+        if self.admitted:
+            self.buffered += size
+            self.settings["admission"].hold(size)
+
+    def end_admission(self):
+        """Give the place of the request to another"""
+        if self.admitted:
+            self.admitted = False
+            self.settings["admission"].release(self.method_label(), self.buffered)
+
+    async def data_received(self, chunk: bytes):
+        """Queue a chunk of the request body to be forwarded upstream"""
+        if self.settings.get("metrics") is not None:
+            self.settings["metrics"].bytes_received += len(chunk)
+        if self.post_body is not None:
+            self.post_body.append(chunk)
+            return
+        # Discard the body when there is nowhere to send it
+        if self.upload is None or self.upload.done():
+            return
+        await self.body_queue.put(chunk)
+
+    def on_connection_close(self):
+        """Abort a streamed upload when the client goes away"""
+        super().on_connection_close()
+        self.end_in_flight()
+        self.end_admission()
+        if self.upload is None:
+            return
+        # Nothing awaits the upload once its client is gone
+        self.upload.add_done_callback(
+            lambda future: future.cancelled() or future.exception()
+        )
+        if self.upload.done():
+            return
+        self.drain_body_queue()
+        self.body_queue.put_nowait(tornado.iostream.StreamClosedError())
+
+    def drain_body_queue(self):
+        """Discard queued body chunks, unblocking any pending `data_received'"""
+        while self.body_queue is not None and not self.body_queue.empty():
+            self.body_queue.get_nowait()
+
+    async def body_chunks(self):
+        """Yield request body chunks as they are received from the client"""
+        while True:
+            chunk = await self.body_queue.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    async def delete(self, **kwargs):
+        """Handle HTTP DELETE requests
+
+        See Also:
+          https://docs.aws.amazon.com/AmazonS3/latest/API/API_DeleteObject.html
+        """
+        name = "AWSv4Handler.delete"
+        logger.debug("%s - **kwargs: %r", name, kwargs)
+
+        # This method requires admin
+        if not self.settings.get("admin", False):
+            self.set_status(405)
+            self.set_header("Cache-Control", "private, no-store")
+            self.set_header("Content-Type", "text/plain")
+            return
+
+        if self.request.path.endswith("/ping"):
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
+            self.set_header("Cache-Control", "private, no-store")
+            self.set_header("Content-Type", "text/plain")
+            self.write("pong\n")
+            return
+
+        return await self.fetch(**kwargs)
 
-class AWSv4Handler(tornado.web.RequestHandler):
-    """Handle making HTTP requests using the AWSv4 signature
+    async def head(self, **kwargs):
+        """Handle HTTP HEAD requests
 
-    See Also:
-      https://www.tornadoweb.org/en/stable/web.html
-      https://docs.aws.amazon.com/general/latest/gr/sigv4-signed-request-examples.html
-    """
+        See Also:
+          https://docs.aws.amazon.com/AmazonS3/latest/API/API_HeadObject.html
+        """
+        name = "AWSv4Handler.head"
+        logger.debug("%s - **kwargs: %r", name, kwargs)
 
-    def initialize(self, **kwargs):
-        name = "AWSv4Handler.initialize"
-        logging.debug(f"{name} - **kwargs: {kwargs!r}")
+        if self.request.path.endswith("/ping"):
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
+            self.set_header("Cache-Control", "private, no-store")
+            self.set_header("Content-Type", "text/plain")
+            return
 
-    async def delete(self, **kwargs):
-        """Handle HTTP DELETE requests
+        return await self.fetch(**kwargs)
+
+    async def get(self, **kwargs):
+        """Handle HTTP GET requests
 
         See Also:
-          https://docs.aws.amazon.com/AmazonS3/latest/API/API_DeleteObject.html
+          https://docs.aws.amazon.com/AmazonS3/latest/API/API_GetObject.html
         """
-        name = "AWSv4Handler.delete"
-        logging.debug(f"{name} - **kwargs: {kwargs!r}")
+        name = "AWSv4Handler.get"
+        logger.debug("%s - **kwargs: %r", name, kwargs)
+
+        if self.request.path.endswith("/ping"):
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
+            self.set_header("Cache-Control", "private, no-store")
+            self.set_header("Content-Type", "text/plain")
+            self.write("pong\n")
+            return
+
+        if self.request.path == "/metrics" and self.settings.get("metrics") is not None:
+            # https://prometheus.io/docs/instrumenting/exposition_formats/
+            self.set_header("Cache-Control", "private, no-store")
+            self.set_header("Content-Type", "text/plain; version=0.0.4")
+            self.write(
+                self.settings["metrics"].expose(
+                    upstream=self.settings["upstream"],
+                    cache=self.settings.get("cache"),
+                    flights=self.settings.get("flights"),
+                    access_log=self.settings.get("log_function"),
+                    router=self.settings["router"],
+                    negative_cache=self.settings.get("negative_cache"),
+                    metadata_index=self.settings.get("metadata_index"),
+                    admission=self.settings.get("admission"),
+                )
+            )
+            return
+
+        if self.request.path == "/_profile" and self.settings.get("admin", False):
+            return await self.profile()
+
+        if (
+            self.settings.get("list_objects", False)
+            and self.get_query_argument("list-type", None) == "2"
+            and self.object_path == "/"
+            and not self.settings.get("auth_only", False)
+            and not self.request.headers.get("X-Auth-Only", False)
+        ):
+            return await self.list_objects()
+
+        if self.settings.get("redirect", False) and await self.redirect_presigned():
+            return
+
+        return await self.fetch(**kwargs)
+
+    async def post(self, **kwargs):
+        """Handle HTTP POST requests to sign a batch of requests
+
+        In auth-only mode, POST /sign takes a JSON list of requests to sign,
+        either {"method": "GET", "path": "/key"} objects or [method, path]
+        pairs, and returns the URL and signed headers of each in one JSON
+        response. PUT and DELETE requests require admin.
+        """
+        name = "AWSv4Handler.post"
+        logger.debug("%s - **kwargs: %r", name, kwargs)
+
+        auth_only = self.settings.get("auth_only", False) or self.request.headers.get(
+            "X-Auth-Only", False
+        )
+        self.set_header("Cache-Control", "private, no-store")
+        if self.request.path != "/sign" or not auth_only:
+            self.set_status(405)
+            self.set_header("Content-Type", "text/plain")
+            return
+
+        methods = ["GET", "HEAD"]
+        if self.settings.get("admin", False):
+            methods += ["PUT", "DELETE"]
+        try:
+            batch = json.loads(b"".join(self.post_body))
+            if not isinstance(batch, list):
+                raise TypeError("expected a list of requests")
+            if len(batch) > int(self.settings.get("sign_batch_size", 1000)):
+                raise ValueError("too many requests")
+            requests = []
+            for item in batch:
+                if isinstance(item, dict):
+                    method, path = item.get("method", "GET"), item.get("path")
+                else:
+                    method, path = item
+                method = str(method).upper()
+                if method not in methods:
+                    raise ValueError(f"method not allowed: {method}")
+                if not isinstance(path, str) or not path.startswith("/"):
+                    raise ValueError(f"invalid path: {path!r}")
+                requests.append((method, path))
+        except (TypeError, ValueError) as err:
+            self.set_status(400)
+            self.set_header("Content-Type", "text/plain")
+            self.write(f"Invalid batch signing request: {err}\n")
+            return
+
+        # Every request shares the cached signing key of the day
+        router = self.settings["router"]
+        started = time.perf_counter()
+        signed = []
+        for method, path in requests:
+            payload_hash = UNSIGNED_PAYLOAD if method == "PUT" else EMPTY_PAYLOAD
+            backend, object_path = router.route(self.request.host, path)
+            request_url, request_headers = backend.choose().sign(
+                method, object_path, payload_hash=payload_hash
+            )
+            x_host, x_uri_path = request_url.split("://", 1)[-1].split("/", 1)
+            signed.append(
+                {
+                    "method": method,
+                    "path": path,
+                    "host": x_host,
+                    "url": request_url,
+                    "uri_path": f"/{x_uri_path}",
+                    "headers": request_headers,
+                }
+            )
+        if self.settings.get("metrics") is not None:
+            self.settings["metrics"].signing.observe(time.perf_counter() - started)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(signed))
+
+    async def put(self, **kwargs):
+        """Handle HTTP PUT requests
+
+        See Also:
+          https://docs.aws.amazon.com/AmazonS3/latest/API/API_PutObject.html
+        """
+        name = "AWSv4Handler.put"
+        logger.debug("%s - **kwargs: %r", name, kwargs)
 
         # This method requires admin
         if not self.settings.get("admin", False):
@@ -55,349 +3057,1503 @@ class AWSv4Handler(tornado.web.RequestHandler):
             self.write("pong\n")
             return
 
-        return await self.fetch(**kwargs)
+        if self.upload is None:
+            return await self.fetch(**kwargs)
+
+        # The upstream request was started in `prepare'; mark the end of the
+        # body and wait for the upstream response
+        if not self.upload.done():
+            await self.body_queue.put(None)
+        return await self.upload
+
+    async def fetch(self, **kwargs):
+        """Request an object using a AWSv4 signature
+
+        See Also:
+          https://www.tornadoweb.org/en/stable/httpclient.html
+        """
+        name = "AWSv4Handler.fetch"
+        logger.debug("%s - **kwargs: %r", name, kwargs)
+        logger.debug("%s - auth_only: %r", name, self.settings.get("auth_only", False))
+        logger.debug(
+            "%s - X-Auth-Only: %r", name, self.request.headers.get("X-Auth-Only", False)
+        )
+        auth_only = self.settings.get("auth_only", False) or self.request.headers.get(
+            "X-Auth-Only", False
+        )
+
+        # Large uploads are split into parts which are uploaded concurrently
+        multipart_threshold = int(self.settings.get("multipart_threshold", 0))
+        if (
+            self.request.method == "PUT"
+            and not auth_only
+            and multipart_threshold > 0
+            and int(self.request.headers["Content-Length"]) > multipart_threshold
+        ):
+            return await self.multipart_upload(**kwargs)
+
+        # Answer requests for objects known to be missing without upstream
+        negative_cache = self.settings.get("negative_cache")
+        if (
+            negative_cache is not None
+            and not auth_only
+            and self.request.method in ["GET", "HEAD"]
+        ):
+            code = negative_cache.get(self.cache_key())
+            if code is not None:
+                self.set_cache_status("HIT")
+                self.set_status(code)
+                return
+
+        # Answer HEAD and conditional GET requests from the metadata index
+        metadata_index = self.settings.get("metadata_index")
+        if (
+            metadata_index is not None
+            and not auth_only
+            and self.request.method in ["GET", "HEAD"]
+            and self.request.headers.get("Range") is None
+        ):
+            metadata = metadata_index.get(self.cache_key())
+            if metadata is not None and self.write_metadata(metadata):
+                return
+
+        # Uploads are streamed so the payload can not be hashed up front
+        payload_hash, payload_headers = None, {}
+        if self.request.method == "PUT":
+            payload_hash, payload_headers = self.payload_signing(auth_only)
+        request_url, request_headers = self.sign_request(
+            payload_hash=payload_hash, headers=payload_headers, **kwargs
+        )
+        logger.debug("%s - request_url: %r", name, request_url)
+        logger.debug("%s - request_headers: %r", name, request_headers)
+
+        # When `auth_only' is enabled, return the signed headers in the
+        # response WITHOUT making a request upstream.
+        if auth_only:
+            # With auth-only never cache
+            self.set_header("Cache-Control", "private, no-store")
+            self.set_header("Content-Type", "text/plain")
+            x_host, x_uri_path = request_url.split("://", 1)[-1].split("/", 1)
+            self.set_header("X-Host", x_host)
+            self.set_header("X-URL", request_url)
+            self.set_header("X-URI-Path", f"/{x_uri_path}")
+            for name, value in request_headers.items():
+                self.set_header(name, value)
+            return
+        self.forwarded = True
+
+        # Allow some request headers to pass through
+        # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers
+        # https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests#validators
+        for header_name in [
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/If-Modified-Since
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Last-Modified
+            "If-Modified-Since",
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/If-None-Match
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/ETag
+            "If-None-Match",
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Range
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/If-Range
+            "Range",
+            "If-Range",
+        ]:
+            header_value = self.request.headers.get(header_name)
+            logger.debug("%s - %s: %r", name, header_name, header_value)
+            if header_name is not None and header_value is not None:
+                request_headers[header_name] = str(header_value)
+        logger.debug("%s - request_headers: %r", name, request_headers)
+
+        # HTTP client request parameters
+        # https://www.tornadoweb.org/en/stable/httpclient.html#request-objects
+        request = {
+            "url": request_url,
+            "method": self.request.method,
+            "headers": request_headers,
+            "connect_timeout": int(self.settings.get("connect_timeout", 6)),
+            "request_timeout": int(self.settings.get("request_timeout", 12)),
+        }
+        # Additional options for some HTTP methods
+        if self.request.method == "PUT":
+            # Forward the body as it is received from the client
+            request.update(
+                body_producer=self.body_producer(request_headers),
+                request_timeout=int(self.settings.get("upload_timeout", 3600)),
+            )
+
+            # Set the Content-Type
+            # https://docs.python.org/3/library/mimetypes.html#mimetypes.guess_type
+            content_type, encoding = guess_type(self.request.path)
+            if content_type is None:
+                content_type = "application/octet-stream"
+            logger.debug("%s - content_type: %r", name, content_type)
+            request["headers"]["Content-Type"] = content_type
+
+        # Serve GET/HEAD responses from the object cache while it is fresh
+        cache, entry = self.settings.get("cache"), None
+        if cache is not None and self.request.method in ["GET", "HEAD"]:
+            entry = self.cache_entry = cache.get(self.cache_key())
+            if entry is not None and cache.fresh(entry):
+                return await self.write_cached(entry, "HIT")
+            if cache.usable_stale(entry, cache.stale_while_revalidate):
+                # Serve the expired copy while it is revalidated
+                self.revalidate(entry)
+                return await self.write_cached(entry, "STALE")
+            if entry is not None:
+                # Revalidate the cached copy instead of the client's copy
+                for header_name, header_value in [
+                    ("If-Modified-Since", entry.last_modified),
+                    ("If-None-Match", entry.etag),
+                ]:
+                    request_headers.pop(header_name, None)
+                    if header_value is not None:
+                        request_headers[header_name] = header_value
+            self.set_cache_status("MISS")
+
+        # Fetch large objects in ranges concurrently
+        if (
+            self.request.method == "GET"
+            and int(self.settings.get("parallel_range_size") or 0) > 0
+            and self.request.headers.get("Range") is None
+        ):
+            return await self.fetch_ranges(request, entry=entry)
+
+        # Relay GET/HEAD responses to the client as they arrive
+        if self.settings.get("stream_response", False) and self.request.method in [
+            "GET",
+            "HEAD",
+        ]:
+            return await self.fetch_stream(request, entry=entry)
+
+        # Create the HTTP client request object
+        # https://www.tornadoweb.org/en/stable/httpclient.html#request-objects
+        http_request = tornado.httpclient.HTTPRequest(**request)
+
+        # Make the HTTP request, or wait on an identical one already made
+        flight, leader = self.start_flight(request)
+        if leader:
+            flight.run(self.settings["upstream"].fetch(http_request))
+        try:
+            response = await flight.wait()
+            if leader:
+                self.hold_buffered(len(response.body))
+            request_time = 1000.0 * getattr(response, "request_time", 0)
+            logger.info(
+                "%s %s %s %0.2fms %sB",
+                response.code,
+                response.request.method,
+                response.effective_url,
+                request_time,
+                len(response.body),
+            )
+
+            logger.debug("%s - response.headers: %r", name, response.headers)
+            self.index_metadata(response.code, response.headers)
+
+            self.set_header(
+                "Content-Type",
+                response.headers.get("Content-Type", "application/octet-stream"),
+            )
+            if response.headers.get("Etag") is not None:
+                self.set_header("Etag", response.headers.get("Etag"))
+            for header_name in ["Last-Modified", "Accept-Ranges", "Content-Range"]:
+                if response.headers.get(header_name) is not None:
+                    self.set_header(header_name, response.headers.get(header_name))
+            self.set_status(response.code)
+            if cache is not None and self.request.method in ["GET", "HEAD"]:
+                if leader:
+                    entry = self.update_cache(
+                        entry, response.code, response.headers, response.body
+                    )
+                elif response.code == 200:
+                    # The leader of the flight has updated the cache
+                    entry = self.use_cache_entry(cache.get(self.cache_key()))
+                if entry is not None:
+                    return await self.write_cached(entry, "MISS")
+            if response.body and len(response.body) > 0:
+                self.write(response.body)
+
+        except (tornado.httpclient.HTTPError, OSError) as err:
+            response = getattr(err, "response", None)
+            if response is None:
+                # No response from upstream; it is down or the connection was lost
+                logger.warning(f"{name} - {request['method']} {request['url']}: {err}")
+                if self.stale_if_error(entry):
+                    return await self.write_cached(entry, "STALE")
+                self.set_status(502)
+                return
+            request_time = 1000.0 * getattr(response, "request_time", 0)
+            logger.warning(
+                "%s %s %s %0.2fms %sB",
+                response.code,
+                response.request.method,
+                response.effective_url,
+                request_time,
+                len(response.body),
+            )
+
+            logger.debug("%s - response.headers: %r", name, response.headers)
+            if self.settings.get("debug", False):
+                logger.debug("%s - response.body: %r", name, response.body)
+
+            if self.stale_if_error(entry, response.code):
+                return await self.write_cached(entry, "STALE")
+            self.set_status(response.code)
+            self.remember_missing(response.code)
+            self.index_metadata(response.code, response.headers)
+            if response.code == 416 and response.headers.get("Content-Range"):
+                self.set_header("Content-Range", response.headers.get("Content-Range"))
+            if cache is not None and self.request.method in ["GET", "HEAD"]:
+                entry = self.update_cache(entry, response.code, response.headers)
+                if entry is not None:
+                    return await self.write_cached(entry, "REVALIDATED")
+
+    async def fetch_stream(self, request: dict, entry: CacheEntry = None):
+        """Relay an upstream response to the client as it arrives
+
+        The status and headers are forwarded as soon as they are received and
+        the body is flushed to the client every `stream_buffer_size' bytes.
+        Reading from upstream is paused while a flush is pending, which caps
+        the memory held per request. Bodies small enough for the object cache
+        are also kept and cached once complete.
+
+        Identical requests which arrive before the body are relayed the same
+        response; reading from upstream then waits on the slowest client.
+
+        See Also:
+          https://www.tornadoweb.org/en/stable/httpclient.html#tornado.httpclient.HTTPRequest
+        """
+        name = "AWSv4Handler.fetch_stream"
+        buffer_size = int(self.settings.get("stream_buffer_size", 65536))
+        logger.debug("%s - buffer_size: %r", name, buffer_size)
+        cache = self.settings.get("cache")
+        flight, leader = self.start_flight(request)
+        if not leader and flight.headers_received:
+            self.relay_flight_headers(flight)
+
+        def header_callback(line: str):
+            if flight.code is None:
+                start_line = tornado.httputil.parse_response_start_line(line.strip())
+                flight.code = start_line.code
+            elif line.strip():
+                flight.headers.parse_line(line)
+            else:
+                # A blank line marks the end of the headers
+                flight.headers_received = True
+                if (
+                    cache is not None
+                    and flight.code == 200
+                    and self.request.method == "GET"
+                ):
+                    flight.fill = cache.fill(self.cache_key(), flight.headers)
+                for handler in flight.handlers:
+                    handler.relay_flight_headers(flight)
+
+        def streaming_callback(chunk: bytes):
+            flight.size += len(chunk)
+            # Only successful responses have a body which is relayed
+            if flight.code not in [200, 206]:
+                return None
+            if flight.fill is not None and not flight.fill.write(chunk):
+                flight.fill = None
+            for handler in flight.handlers:
+                handler.write(chunk)
+            flight.pending += len(chunk)
+            if flight.pending < buffer_size:
+                return None
+            flight.pending = 0
+            return flush()
+
+        async def flush():
+            try:
+                await flight.flush()
+            except tornado.iostream.StreamClosedError:
+                # Every client went away; stop reading the upstream response
+                http_request.stream.close()
+
+        if leader:
+            request.update(
+                header_callback=header_callback,
+                streaming_callback=streaming_callback,
+                # Relay the body as-is so Content-Length stays valid
+                decompress_response=False,
+                follow_redirects=False,
+            )
+            http_request = tornado.httpclient.HTTPRequest(**request)
+            flight.run(self.settings["upstream"].fetch(http_request))
+
+        try:
+            response = await flight.wait()
+            log = logger.info
+            self.index_metadata(response.code, flight.headers)
+            if cache is not None and leader:
+                self.update_cache(
+                    entry, response.code, flight.headers, fill=flight.fill
+                )
+        except (tornado.httpclient.HTTPError, OSError) as err:
+            response = getattr(err, "response", None)
+            log = logger.warning
+            if response is None and not flight.handlers:
+                # Every client went away, so the flight was dropped
+                logger.debug(f"{name} - {request['method']} {request['url']}: {err}")
+                return
+            if response is None:
+                # No response from upstream; it is down or the connection was lost
+                logger.warning(f"{name} - {request['method']} {request['url']}: {err}")
+                if self._headers_written:
+                    # It is too late to change the status; drop the client
+                    self.request.connection.stream.close()
+                elif self.stale_if_error(entry):
+                    await self.write_cached(entry, "STALE")
+                else:
+                    self.set_status(502)
+                return
+            if flight.code is None:
+                self.set_status(response.code)
+            self.remember_missing(response.code)
+            self.index_metadata(response.code, flight.headers)
+            if not self._headers_written and self.stale_if_error(entry, response.code):
+                await self.write_cached(entry, "STALE")
+            elif cache is not None:
+                entry = self.update_cache(entry, response.code, flight.headers)
+                if entry is not None:
+                    await self.write_cached(entry, "REVALIDATED")
+        finally:
+            # Remove the partial body of a response which was not cached
+            if leader and flight.fill is not None:
+                flight.fill.discard()
+        log(
+            "%s %s %s %0.2fms %sB",
+            response.code,
+            response.request.method,
+            response.effective_url,
+            1000.0 * getattr(response, "request_time", 0),
+            flight.size,
+        )
+
+    async def fetch_ranges(self, request: dict, entry: CacheEntry = None):
+        """Fetch an object in ranges concurrently and relay them in order
+
+        The first `parallel_range_size' bytes are requested on their own,
+        which gives the object size. Objects no larger than that are handled
+        like any other response. The remaining ranges of larger objects are
+        requested with at most `parallel_range_concurrency' in flight and an
+        `If-Match' of the first range's Etag, so every range is from the same
+        version of the object.
+
+        See Also:
+          https://docs.aws.amazon.com/whitepapers/latest/s3-optimizing-performance-best-practices/use-byte-range-fetches.html
+        """
+        name = "AWSv4Handler.fetch_ranges"
+        part_size = int(self.settings.get("parallel_range_size"))
+        concurrency = max(1, int(self.settings.get("parallel_range_concurrency", 4)))
+        upstream = self.settings["upstream"]
+        cache = self.settings.get("cache")
+        started = time.monotonic()
+
+        def fetch_range(start: int, end: int, **headers):
+            range_request = dict(request)
+            range_request["headers"] = {
+                **request["headers"],
+                "Range": f"bytes={start}-{end - 1}",
+                **headers,
+            }
+            return upstream.fetch(tornado.httpclient.HTTPRequest(**range_request))
+
+        try:
+            response = await fetch_range(0, part_size)
+        except (tornado.httpclient.HTTPError, OSError) as err:
+            response = getattr(err, "response", None)
+            if response is None:
+                # No response from upstream; it is down or the connection was lost
+                logger.warning(f"{name} - {request['method']} {request['url']}: {err}")
+                if self.stale_if_error(entry):
+                    return await self.write_cached(entry, "STALE")
+                self.set_status(502)
+                return
+            if self.stale_if_error(entry, response.code):
+                logger.warning(
+                    f"{response.code} {request['method']} {request['url']}: "
+                    "serving a stale copy"
+                )
+                return await self.write_cached(entry, "STALE")
+            self.remember_missing(response.code)
+            self.index_metadata(response.code, response.headers)
+            if response.code == 416:
+                # Empty objects have no satisfiable ranges
+                response = await upstream.fetch(
+                    tornado.httpclient.HTTPRequest(**request), raise_error=False
+                )
+            logger.warning(
+                f"{response.code} {request['method']} {request['url']} "
+                f"{1000.0 * (time.monotonic() - started):0.2f}ms"
+            )
+            if cache is not None and response.code in [200, 304, 404, 410]:
+                entry = self.update_cache(
+                    entry, response.code, response.headers, response.body
+                )
+                if entry is not None:
+                    return await self.write_cached(entry, "REVALIDATED")
+            self.relay_headers(response.code, response.headers)
+            if response.code == 200:
+                self.write(response.body)
+            return
+
+        # Relay the response as a whole object
+        headers = tornado.httputil.HTTPHeaders(response.headers)
+        content_range = headers.pop("Content-Range", None)
+        size = len(response.body)
+        if response.code == 206 and content_range is not None:
+            size = int(content_range.rsplit("/", 1)[-1])
+        headers["Content-Length"] = str(size)
+        self.index_metadata(200, headers)
+        if size == len(response.body):
+            if cache is not None:
+                entry = self.update_cache(entry, 200, headers, response.body)
+                if entry is not None:
+                    return await self.write_cached(entry, "MISS")
+            self.relay_headers(200, headers)
+            self.write(response.body)
+            return
+
+        self.relay_headers(200, headers)
+        self.write(response.body)
+        if_match = {"If-Match": headers["Etag"]} if headers.get("Etag") else {}
+        starts = iter(range(len(response.body), size, part_size))
+        pending = collections.deque()
+
+        def fetch_next():
+            for start in starts:
+                pending.append(
+                    asyncio.ensure_future(
+                        fetch_range(start, min(start + part_size, size), **if_match)
+                    )
+                )
+                return
+
+        self.hold_buffered(part_size * concurrency)
+        for _ in range(concurrency):
+            fetch_next()
+        try:
+            await self.flush()
+            while pending:
+                part = await pending.popleft()
+                fetch_next()
+                self.write(part.body)
+                await self.flush()
+        except (
+            tornado.httpclient.HTTPError,
+            tornado.iostream.StreamClosedError,
+        ) as err:
+            # It is too late to change the status; drop the client
+            logger.warning(f"{name} - {request['method']} {request['url']}: {err}")
+            for future in pending:
+                future.cancel()
+            self.request.connection.stream.close()
+            return
+        logger.info(
+            "%s %s %s %0.2fms %sB in %s ranges",
+            200,
+            request["method"],
+            request["url"],
+            1000.0 * (time.monotonic() - started),
+            size,
+            -(-size // part_size),
+        )
+
+    def start_flight(self, request: dict) -> tuple:
+        """Return the flight for an upstream request and if this request leads it
+
+        GET and HEAD requests join an identical upstream request which is
+        already in flight, when there is one.
+        """
+        flights = self.settings.get("flights")
+        if flights is None or self.request.method not in ["GET", "HEAD"]:
+            return Flight(self), True
+        key = (
+            request["method"],
+            self.cache_key(),
+            request["headers"].get("If-None-Match"),
+            request["headers"].get("If-Modified-Since"),
+            request["headers"].get("Range"),
+            request["headers"].get("If-Range"),
+        )
+        flight = flights.join(key, self)
+        if flight is not None:
+            return flight, False
+        return flights.start(key, self), True
+
+    def relay_flight_headers(self, flight: Flight):
+        """Relay the status and headers of a flight's upstream response"""
+        if flight.code == 304 and self.cache_entry is not None:
+            # The cached copy is still valid; it is sent once complete
+            return
+        if self.stale_if_error(self.cache_entry, flight.code):
+            # The stale cached copy is sent instead of the error
+            return
+        self.relay_headers(flight.code, flight.headers)
+
+    def write_metadata(self, metadata: ObjectMetadata) -> bool:
+        """Answer a HEAD, or a GET when the client's copy is current, locally
+
+        Returns False when a GET has to be sent upstream for its body.
+        """
+        headers = metadata.headers()
+        for header_name, header_value in headers.items():
+            self.set_header(header_name, header_value)
+        if not self.not_modified(metadata) and self.request.method == "GET":
+            for header_name in headers:
+                self.clear_header(header_name)
+            return False
+        self.set_cache_status("HIT")
+        self.set_header("Accept-Ranges", "bytes")
+        if self.not_modified(metadata):
+            self.set_status(304)
+            return True
+        self.set_header("Content-Length", metadata.size)
+        return True
+
+    def index_metadata(self, code: int, headers: tornado.httputil.HTTPHeaders):
+        """Update the metadata index from an upstream GET or HEAD response"""
+        metadata_index = self.settings.get("metadata_index")
+        if metadata_index is not None and self.request.method in ["GET", "HEAD"]:
+            metadata_index.update(self.cache_key(), code, headers)
+
+    def remember_missing(self, code: int):
+        """Remember a GET/HEAD of a missing or forbidden object"""
+        negative_cache = self.settings.get("negative_cache")
+        if (
+            negative_cache is not None
+            and code in [403, 404]
+            and self.request.method in ["GET", "HEAD"]
+        ):
+            negative_cache.put(self.cache_key(), code)
+
+    def stale_if_error(self, entry: CacheEntry, code: int | None = None) -> bool:
+        """Return True when a stale entry may be served as upstream failed
+
+        The `code' of the upstream response is None when there was none.
+        """
+        cache = self.settings.get("cache")
+        return (
+            (code is None or code >= 500)
+            and cache is not None
+            and cache.usable_stale(entry, cache.stale_if_error)
+        )
+
+    def revalidate(self, entry: CacheEntry):
+        """Revalidate a stale cache entry upstream in the background
+
+        At most one revalidation per object is in flight, whichever request
+        started it; requests meanwhile are served the stale entry.
+        """
+        cache = self.settings["cache"]
+        key = self.cache_key()
+        if key in cache.revalidating:
+            return
+        cache.revalidating.add(key)
+        # A HEAD request also refreshes the cached body
+        request_url, request_headers = self.sign_request(method="GET")
+        for header_name, header_value in [
+            ("If-Modified-Since", entry.last_modified),
+            ("If-None-Match", entry.etag),
+        ]:
+            if header_value is not None:
+                request_headers[header_name] = header_value
+        http_request = tornado.httpclient.HTTPRequest(
+            url=request_url,
+            method="GET",
+            headers=request_headers,
+            connect_timeout=int(self.settings.get("connect_timeout", 6)),
+            request_timeout=int(self.settings.get("request_timeout", 12)),
+        )
+        tornado.ioloop.IOLoop.current().spawn_callback(
+            self.background_revalidate, key, entry, http_request
+        )
+
+    async def background_revalidate(
+        self, key: str, entry: CacheEntry, request: tornado.httpclient.HTTPRequest
+    ):
+        """Update the object cache from a background revalidation request"""
+        name = "AWSv4Handler.background_revalidate"
+        cache = self.settings["cache"]
+        try:
+            response = await self.settings["upstream"].fetch(request, raise_error=False)
+        except (tornado.httpclient.HTTPError, OSError) as err:
+            logger.warning("%s - %s %s: %s", name, request.method, request.url, err)
+            return
+        finally:
+            cache.revalidating.discard(key)
+        logger.info(
+            "%s %s %s %0.2fms %sB revalidated in the background",
+            response.code,
+            request.method,
+            response.effective_url,
+            1000.0 * response.request_time,
+            len(response.body),
+        )
+        if response.code == 304:
+            cache.refresh(key, entry)
+        elif response.code == 200:
+            cache.put(key, response.body, response.headers)
+        elif response.code in [404, 410]:
+            cache.pop(key)
+
+    def use_cache_entry(self, entry: CacheEntry) -> CacheEntry:
+        """Replace the object cache entry used for the response"""
+        if self.cache_entry is not None and self.cache_entry is not entry:
+            self.cache_entry.close()
+        self.cache_entry = entry
+        return entry
+
+    async def redirect_presigned(self) -> bool:
+        """Redirect a GET request to a presigned URL, returning if it was
+
+        Objects below one of `redirect_prefixes', or any object when none are
+        set, are redirected when they are at least `redirect_size' bytes.
+        Their size is found in the metadata index or with a HEAD request
+        upstream; objects which can not be found, or whose size can not be
+        probed, are proxied as usual.
+        Objects in the object cache or the negative cache are answered from
+        it without a HEAD request.
+
+        See Also:
+          https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/307
+        """
+        name = "AWSv4Handler.redirect_presigned"
+        if self.settings.get("auth_only", False) or self.request.headers.get(
+            "X-Auth-Only", False
+        ):
+            return False
+        prefixes = self.settings.get("redirect_prefixes")
+        if prefixes and not self.request.path.startswith(prefixes):
+            return False
+
+        redirect_size = int(self.settings.get("redirect_size", 0))
+        metadata_index = self.settings.get("metadata_index")
+        metadata = None
+        if redirect_size > 0 and metadata_index is not None:
+            metadata = metadata_index.get(self.cache_key())
+        if metadata is not None:
+            if metadata.size < redirect_size:
+                return False
+        elif redirect_size > 0:
+            # Only probe the size of objects which would be fetched upstream
+            for cache in [
+                self.settings.get("cache"),
+                self.settings.get("negative_cache"),
+            ]:
+                if cache is not None and self.cache_key() in cache:
+                    return False
+            request_url, request_headers = self.sign_request(method="HEAD")
+            try:
+                response = await self.settings["upstream"].fetch(
+                    tornado.httpclient.HTTPRequest(
+                        request_url,
+                        method="HEAD",
+                        headers=request_headers,
+                        connect_timeout=int(self.settings.get("connect_timeout", 6)),
+                        request_timeout=int(self.settings.get("request_timeout", 12)),
+                    ),
+                    raise_error=False,
+                )
+            except (tornado.httpclient.HTTPError, OSError) as err:
+                # Proxy the request, which reports the upstream error
+                logger.warning(f"{name} - HEAD {request_url}: {err}")
+                return False
+            size = int(response.headers.get("Content-Length", 0))
+            logger.debug("%s - %s size: %r", name, response.code, size)
+            if metadata_index is not None:
+                metadata_index.update(self.cache_key(), response.code, response.headers)
+            if response.code != 200 or size < redirect_size:
+                return False
 
-    async def head(self, **kwargs):
-        """Handle HTTP HEAD requests
+        # Clients may reuse the redirect for half the time the URL is valid
+        expires = int(self.settings.get("redirect_expires", 300))
+        self.set_header("Cache-Control", f"private, max-age={expires // 2}")
+        self.redirect(
+            self.signer.presign("GET", self.object_path, expires),
+            status=int(self.settings.get("redirect_status", 307)),
+        )
+        return True
+
+    async def profile(self):
+        """Profile the process handling live requests for a few seconds
+
+        Runs `cProfile' for `seconds' (at most 60) and responds with the
+        `limit' functions with the most time, sorted by `sort'. Requests are
+        slower while profiled. Only the worker process handling the request
+        is profiled, and one profile at a time. Profiles are not counted by
+        the admission control.
 
         See Also:
-          https://docs.aws.amazon.com/AmazonS3/latest/API/API_HeadObject.html
+          https://docs.python.org/3/library/profile.html
         """
-        name = "AWSv4Handler.head"
-        logging.debug(f"{name} - **kwargs: {kwargs!r}")
+        self.set_header("Cache-Control", "private, no-store")
+        self.set_header("Content-Type", "text/plain")
+        try:
+            seconds = min(60.0, float(self.get_query_argument("seconds", 10)))
+            limit = int(self.get_query_argument("limit", 30))
+        except ValueError:
+            raise tornado.web.HTTPError(400, "Invalid seconds or limit")
+        sort = self.get_query_argument("sort", "tottime")
+        if sort not in ["tottime", "cumulative", "ncalls"]:
+            raise tornado.web.HTTPError(400, "Invalid sort")
 
-        if self.request.path.endswith("/ping"):
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
-            self.set_header("Cache-Control", "private, no-store")
-            self.set_header("Content-Type", "text/plain")
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profile is running
+            self.set_status(409)
+            self.write("A profile is already running\n")
             return
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        report = io.StringIO()
+        stats = pstats.Stats(profiler, stream=report)
+        stats.sort_stats(sort).print_stats(limit)
+        self.write(report.getvalue())
 
-        return await self.fetch(**kwargs)
+    async def list_objects(self):
+        """Relay every page of a ListObjectsV2 listing as JSON or NDJSON
 
-    async def get(self, **kwargs):
-        """Handle HTTP GET requests
+        Pages are requested from upstream in turn, following continuation
+        tokens, and each object and common prefix is written to the client as
+        soon as it is parsed. Reading from upstream waits on flushes to the
+        client, so listing any number of keys uses constant memory. Clients
+        accepting `application/x-ndjson' get one JSON object per line, others
+        a JSON array. The `prefix', `delimiter' and `start-after' parameters
+        are passed upstream and `max-keys' limits the number of results.
 
         See Also:
-          https://docs.aws.amazon.com/AmazonS3/latest/API/API_GetObject.html
+          https://docs.aws.amazon.com/AmazonS3/latest/API/API_ListObjectsV2.html
         """
-        name = "AWSv4Handler.get"
-        logging.debug(f"{name} - **kwargs: {kwargs!r}")
+        name = "AWSv4Handler.list_objects"
+        buffer_size = int(self.settings.get("stream_buffer_size", 65536))
+        ndjson = "application/x-ndjson" in self.request.headers.get("Accept", "")
+        query = {"list-type": "2", "encoding-type": "url"}
+        for argument in ["prefix", "delimiter", "start-after"]:
+            value = self.get_query_argument(argument, None)
+            if value is not None:
+                query[argument] = value
+        try:
+            remaining = int(self.get_query_argument("max-keys", 0)) or None
+        except ValueError:
+            raise tornado.web.HTTPError(400, "Invalid max-keys")
+        self.set_header("Cache-Control", "private, no-store")
+        self.set_header(
+            "Content-Type", "application/x-ndjson" if ndjson else "application/json"
+        )
+        started = time.monotonic()
+        count, pages, pending = 0, 0, 0
+        status = None
 
-        if self.request.path.endswith("/ping"):
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
-            self.set_header("Cache-Control", "private, no-store")
-            self.set_header("Content-Type", "text/plain")
-            self.write("pong\n")
-            return
+        def header_callback(line: str):
+            nonlocal status
+            if line.startswith("HTTP/"):
+                status = tornado.httputil.parse_response_start_line(line.strip()).code
 
-        return await self.fetch(**kwargs)
+        def streaming_callback(chunk: bytes):
+            nonlocal count, pending, remaining
+            if status != 200:
+                return None
+            for item in parser.feed(chunk):
+                if remaining is not None:
+                    if remaining == 0:
+                        break
+                    remaining -= 1
+                line = json.dumps(item)
+                if ndjson:
+                    line = f"{line}\n"
+                else:
+                    line = f"{',' if count else '['}\n{line}"
+                self.write(line)
+                count += 1
+                pending += len(line)
+            if pending < buffer_size:
+                return None
+            pending = 0
+            return self.flush()
 
-    async def put(self, **kwargs):
-        """Handle HTTP PUT requests
+        while True:
+            if remaining is not None:
+                query["max-keys"] = str(min(remaining, 1000))
+            request_url, request_headers = self.sign_request(method="GET", query=query)
+            parser = ListObjectsParser()
+            try:
+                await self.settings["upstream"].fetch(
+                    tornado.httpclient.HTTPRequest(
+                        url=request_url,
+                        method="GET",
+                        headers=request_headers,
+                        connect_timeout=int(self.settings.get("connect_timeout", 6)),
+                        request_timeout=int(self.settings.get("request_timeout", 12)),
+                        header_callback=header_callback,
+                        streaming_callback=streaming_callback,
+                    )
+                )
+            except (
+                tornado.httpclient.HTTPError,
+                OSError,
+                xml.etree.ElementTree.ParseError,
+            ) as err:
+                logger.warning("%s - GET %s: %s", name, request_url, err)
+                if self._headers_written:
+                    # It is too late to change the status; drop the client
+                    self.request.connection.stream.close()
+                    return
+                self.clear()
+                response = getattr(err, "response", None)
+                self.set_status(502 if response is None else response.code)
+                return
+            pages += 1
+            if not parser.truncated or not parser.next_token or remaining == 0:
+                break
+            query["continuation-token"] = parser.next_token
+        if not ndjson:
+            self.write("\n]\n" if count else "[]\n")
+        logger.info(
+            "%s %s %s %0.2fms %s keys in %s pages",
+            200,
+            "GET",
+            request_url,
+            1000.0 * (time.monotonic() - started),
+            count,
+            pages,
+        )
+
+    async def multipart_upload(self, **kwargs):
+        """Upload the request body in parts using a multipart upload
+
+        Parts of `multipart_part_size' bytes, or more for very large objects,
+        are uploaded as the body arrives with at most `multipart_concurrency'
+        parts in flight. The upload is aborted upstream when any part fails.
 
         See Also:
-          https://docs.aws.amazon.com/AmazonS3/latest/API/API_PutObject.html
+          https://docs.aws.amazon.com/AmazonS3/latest/userguide/mpuoverview.html
         """
-        name = "AWSv4Handler.put"
-        logging.debug(f"{name} - **kwargs: {kwargs!r}")
+        name = "AWSv4Handler.multipart_upload"
+        self.forwarded = True
+        # Parts must be at least 5 MiB except for the last one, and there
+        # may be at most 10,000 of them
+        part_size = multipart_part_size(
+            int(self.request.headers["Content-Length"]),
+            self.settings.get("multipart_part_size", 16 * 1024**2),
+        )
+        concurrency = max(1, int(self.settings.get("multipart_concurrency", 4)))
+        logger.debug("%s - part_size: %r", name, part_size)
+        logger.debug("%s - concurrency: %r", name, concurrency)
+        self.hold_buffered(part_size * concurrency)
 
-        # This method requires admin
-        if not self.settings.get("admin", False):
-            self.set_status(405)
-            self.set_header("Cache-Control", "private, no-store")
-            self.set_header("Content-Type", "text/plain")
-            return
+        # https://docs.python.org/3/library/mimetypes.html#mimetypes.guess_type
+        content_type, _ = guess_type(self.request.path)
+        if content_type is None:
+            content_type = "application/octet-stream"
 
-        if self.request.path.endswith("/ping"):
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
-            self.set_header("Cache-Control", "private, no-store")
-            self.set_header("Content-Type", "text/plain")
-            self.write("pong\n")
-            return
+        try:
+            # https://docs.aws.amazon.com/AmazonS3/latest/API/API_CreateMultipartUpload.html
+            response = await self.upstream_fetch(
+                "POST",
+                query={"uploads": ""},
+                headers={"Content-Type": content_type},
+                body=b"",
+            )
+            match = re.search(rb"<UploadId>(.*?)</UploadId>", response.body)
+            if match is None:
+                raise tornado.httpclient.HTTPClientError(
+                    502, "No UploadId in the CreateMultipartUpload response"
+                )
+            upload_id = html.unescape(match.group(1).decode("utf-8"))
+            logger.debug("%s - upload_id: %r", name, upload_id)
 
-        return await self.fetch(**kwargs)
+            parts = {}
+            errors = []
+            semaphore = tornado.locks.Semaphore(concurrency)
 
-    @staticmethod
-    def _sign(key: bytes, msg: str) -> str:
-        """Return a new HMAC SHA256 digest"""
-        return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+            async def upload_part(part_number: int, body: bytes):
+                # https://docs.aws.amazon.com/AmazonS3/latest/API/API_UploadPart.html
+                try:
+                    response = await self.upstream_fetch(
+                        "PUT",
+                        query={"partNumber": part_number, "uploadId": upload_id},
+                        body=body,
+                    )
+                    if response.headers.get("Etag") is None:
+                        raise tornado.httpclient.HTTPClientError(
+                            502, f"No ETag in the UploadPart {part_number} response"
+                        )
+                    parts[part_number] = response.headers["Etag"]
+                except (tornado.httpclient.HTTPError, OSError) as err:
+                    errors.append(err)
+                finally:
+                    semaphore.release()
 
-    def _get_aws4_signature(
-        self, secret_key: str, date: str, region: str, service: str
-    ) -> str:
-        """Return a AWSv4 signature"""
-        w_date = self._sign(("AWS4" + secret_key).encode("utf-8"), date)
-        w_region = self._sign(w_date, region)
-        w_service = self._sign(w_region, service)
-        aws4_signature = self._sign(w_service, "aws4_request")
-        return aws4_signature
+            tasks = []
+            try:
+                buffer = bytearray()
+                async for chunk in self.body_chunks():
+                    buffer += chunk
+                    while len(buffer) >= part_size:
+                        # Stop reading the body while too many parts are in flight
+                        await semaphore.acquire()
+                        if errors:
+                            raise errors[0]
+                        body = bytes(buffer[:part_size])
+                        del buffer[:part_size]
+                        tasks.append(
+                            asyncio.ensure_future(upload_part(len(tasks) + 1, body))
+                        )
+                if buffer or not tasks:
+                    await semaphore.acquire()
+                    tasks.append(
+                        asyncio.ensure_future(
+                            upload_part(len(tasks) + 1, bytes(buffer))
+                        )
+                    )
+                await asyncio.gather(*tasks)
+                if errors:
+                    raise errors[0]
 
-    async def fetch(self, **kwargs):
-        """Request an object using a AWSv4 signature
+                # https://docs.aws.amazon.com/AmazonS3/latest/API/API_CompleteMultipartUpload.html
+                complete = "".join(
+                    [
+                        "<CompleteMultipartUpload>",
+                        *[
+                            f"<Part><PartNumber>{part_number}</PartNumber>"
+                            f"<ETag>{html.escape(parts[part_number])}</ETag></Part>"
+                            for part_number in sorted(parts)
+                        ],
+                        "</CompleteMultipartUpload>",
+                    ]
+                ).encode("utf-8")
+                response = await self.upstream_fetch(
+                    "POST",
+                    query={"uploadId": upload_id},
+                    headers={"Content-Type": "application/xml"},
+                    body=complete,
+                )
+                # A complete request may fail after a 200 response was started
+                if b"<Error>" in response.body:
+                    raise tornado.httpclient.HTTPClientError(
+                        502, "Error in the CompleteMultipartUpload response"
+                    )
+
+            except Exception:
+                # https://docs.aws.amazon.com/AmazonS3/latest/API/API_AbortMultipartUpload.html
+                logger.warning(f"{name} - aborting upload_id: {upload_id!r}")
+                await asyncio.gather(*tasks, return_exceptions=True)
+                try:
+                    await self.upstream_fetch("DELETE", query={"uploadId": upload_id})
+                except (tornado.httpclient.HTTPError, OSError) as err:
+                    logger.warning(f"{name} - abort upload_id {upload_id!r}: {err}")
+                raise
+
+            etag = re.search(rb"<ETag>(.*?)</ETag>", response.body)
+            if etag is not None:
+                self.set_header("Etag", html.unescape(etag.group(1).decode("utf-8")))
+            self.set_status(200)
+
+        except (tornado.httpclient.HTTPError, OSError) as err:
+            response = getattr(err, "response", None)
+            if response is None:
+                logger.warning(f"{name} - {self.request.path}: {err}")
+                self.set_status(502)
+            else:
+                self.set_status(response.code)
+
+    async def upstream_fetch(
+        self,
+        method: str,
+        query: dict | None = None,
+        headers: dict | None = None,
+        body: bytes | None = None,
+    ) -> tornado.httpclient.HTTPResponse:
+        """Make a signed request upstream on behalf of the request"""
+        request_url, request_headers = self.sign_request(
+            payload_hash=UNSIGNED_PAYLOAD if body else None,
+            method=method,
+            query=query,
+        )
+        request_headers.update(headers or {})
+        response = await self.settings["upstream"].fetch(
+            tornado.httpclient.HTTPRequest(
+                url=request_url,
+                method=method,
+                headers=request_headers,
+                body=body,
+                connect_timeout=int(self.settings.get("connect_timeout", 6)),
+                request_timeout=int(self.settings.get("upload_timeout", 3600)),
+            )
+        )
+        logger.info(
+            "%s %s %s %0.2fms %sB",
+            response.code,
+            method,
+            response.effective_url,
+            1000.0 * getattr(response, "request_time", 0),
+            len(body or b""),
+        )
+        return response
+
+    def payload_signing(self, auth_only: bool = False) -> tuple:
+        """Return the payload hash and additional headers to sign an upload
 
         See Also:
-          https://www.tornadoweb.org/en/stable/httpclient.html
+          https://docs.aws.amazon.com/AmazonS3/latest/API/sigv4-streaming.html
         """
-        name = "AWSv4Handler.fetch"
-        logging.debug(f"{name} - **kwargs: {kwargs!r}")
-        request_url, request_headers = self.sign_request(**kwargs)
-        logging.debug(f"{name} - request_url: {request_url!r}")
-        logging.debug(f"{name} - request_headers: {request_headers!r}")
+        # Auth-only clients send the body themselves without chunk signatures
+        if auth_only or self.settings.get("payload_signing") != "streaming":
+            return UNSIGNED_PAYLOAD, {}
+        return STREAMING_PAYLOAD, {
+            "Content-Encoding": "aws-chunked",
+            "x-amz-decoded-content-length": self.request.headers["Content-Length"],
+        }
 
-        # When `auth_only' is enabled, return the signed headers in the
-        # response WITHOUT making a request upstream.
-        logging.debug(f"{name} - auth_only: {self.settings.get('auth_only', False)!r}")
-        logging.debug(
-            f"{name} - X-Auth-Only: {self.request.headers.get('X-Auth-Only', False)!r}"
+    def body_producer(self, request_headers: dict):
+        """Return a `body_producer' forwarding the request body upstream
+
+        See Also:
+          https://www.tornadoweb.org/en/stable/httpclient.html#tornado.httpclient.HTTPRequest
+        """
+        size = int(self.request.headers["Content-Length"])
+        if request_headers.get("x-amz-content-sha256") != STREAMING_PAYLOAD:
+            request_headers["Content-Length"] = str(size)
+
+            async def producer(write):
+                async for chunk in self.body_chunks():
+                    await write(chunk)
+
+            return producer
+
+        # Chunks must be at least 8 KiB except for the last one
+        chunk_size = max(8192, int(self.settings.get("stream_buffer_size", 65536)))
+        request_headers["Content-Length"] = str(
+            AWSv4ChunkSigner.encoded_length(size, chunk_size)
+        )
+        amzdate = request_headers["x-amz-date"]
+        signing_key, credential_scope = self.signer.scope(amzdate[:8])
+        signer = AWSv4ChunkSigner(
+            signing_key=signing_key,
+            amzdate=amzdate,
+            credential_scope=credential_scope,
+            seed_signature=request_headers["Authorization"].rsplit("=", 1)[-1],
         )
-        if self.settings.get("auth_only", False) or self.request.headers.get(
-            "X-Auth-Only", False
-        ):
-            # With auth-only never cache
-            self.set_header("Cache-Control", "private, no-store")
-            self.set_header("Content-Type", "text/plain")
-            x_host, x_uri_path = request_url.split("://", 1)[-1].split("/", 1)
-            self.set_header("X-Host", x_host)
-            self.set_header("X-URL", request_url)
-            self.set_header("X-URI-Path", f"/{x_uri_path}")
-            for name, value in request_headers.items():
-                self.set_header(name, value)
-            return
 
-        # Allow some request headers to pass through
-        # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers
-        # https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests#validators
+        async def producer(write):
+            buffer = bytearray()
+            async for chunk in self.body_chunks():
+                buffer += chunk
+                while len(buffer) >= chunk_size:
+                    await write(signer.sign(bytes(buffer[:chunk_size])))
+                    del buffer[:chunk_size]
+            if buffer:
+                await write(signer.sign(bytes(buffer)))
+            # A zero length chunk marks the end of the body
+            await write(signer.sign(b""))
+
+        return producer
+
+    def relay_headers(self, code: int, headers: tornado.httputil.HTTPHeaders):
+        """Set the status and headers from an upstream response"""
+        name = "AWSv4Handler.relay_headers"
+        logger.debug("%s - code: %r", name, code)
+        logger.debug("%s - headers: %r", name, headers)
+        self.set_status(code)
+        if code == 416 and headers.get("Content-Range") is not None:
+            self.set_header("Content-Range", headers.get("Content-Range"))
+        if code not in [200, 206, 304]:
+            return
+        for header_name in ["Etag", "Last-Modified"]:
+            if headers.get(header_name) is not None:
+                self.set_header(header_name, headers.get(header_name))
+        if code == 304:
+            return
+        self.set_header(
+            "Content-Type",
+            headers.get("Content-Type", "application/octet-stream"),
+        )
         for header_name in [
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/If-Modified-Since
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Last-Modified
-            "If-Modified-Since",
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/If-None-Match
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/ETag
-            "If-None-Match",
+            "Accept-Ranges",
+            "Content-Encoding",
+            "Content-Length",
+            "Content-Range",
         ]:
-            header_value = self.request.headers.get(header_name)
-            logging.debug(f"{name} - {header_name}: {header_value!r}")
-            if header_name is not None and header_value is not None:
-                request_headers[header_name] = str(header_value)
-        logging.debug(f"{name} - request_headers: {request_headers!r}")
+            if headers.get(header_name) is not None:
+                self.set_header(header_name, headers.get(header_name))
+        # Send the status and headers without waiting on the body
+        self.flush()
 
-        # HTTP client request parameters
-        # https://www.tornadoweb.org/en/stable/httpclient.html#request-objects
-        request = {
-            "url": request_url,
-            "method": self.request.method,
-            "headers": request_headers,
-            "connect_timeout": int(self.settings.get("connect_timeout", 6)),
-            "request_timeout": int(self.settings.get("request_timeout", 12)),
-        }
-        # Additional options for some HTTP methods
-        if self.request.method in ["PUT", "POST"]:
-            # Include body data for some HTTP methods
-            request.update(body=self.request.body)
+    def cache_key(self) -> str:
+        """Return the object cache key for the requested object
 
-            # Set the Content-Type
-            # https://docs.python.org/3/library/mimetypes.html#mimetypes.guess_type
-            content_type, encoding = guess_type(self.request.path)
-            if content_type is None:
-                content_type = "application/octet-stream"
-            logging.debug(
-                f"{name} - content_type {type(content_type)}: {content_type!r}"
-            )
-            request["headers"]["Content-Type"] = content_type
+        The path is decoded, so it matches keys listed by upstream however
+        the client encoded it.
+        """
+        return f"{self.backend.key_prefix}{unquote(self.object_path)}"
 
-        # Create the HTTP client request object
-        # https://www.tornadoweb.org/en/stable/httpclient.html#request-objects
-        http_client = tornado.httpclient.AsyncHTTPClient()
-        http_request = tornado.httpclient.HTTPRequest(**request)
+    def update_cache(
+        self,
+        entry: CacheEntry,
+        code: int,
+        headers: tornado.httputil.HTTPHeaders,
+        body: bytes | None = None,
+        fill: CacheFill = None,
+    ) -> CacheEntry:
+        """Update the object cache from an upstream response
+
+        The body of a successful GET is either given as `body' or was
+        collected by `fill' as it was streamed. Returns the entry to serve the
+        response from, or None when the upstream response should be relayed
+        as-is.
+        """
+        cache = self.settings["cache"]
+        if code == 304 and entry is not None:
+            cache.refresh(self.cache_key(), entry)
+            return entry
+        if code == 200 and self.request.method == "GET":
+            if fill is not None:
+                return fill.commit()
+            if body is not None:
+                return cache.put(self.cache_key(), body, headers)
+        if entry is not None and code in [200, 404, 410]:
+            # The object was removed or changed upstream
+            cache.pop(self.cache_key())
+        return None
 
-        # Make the HTTP request
+    def not_modified(self, entry: CacheEntry) -> bool:
+        """Return True when the client's copy of a cached object is current
+
+        See Also:
+          https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+        """
+        if self.request.headers.get("If-None-Match") is not None:
+            return entry.etag is not None and self.check_etag_header()
+        if_modified_since = self.request.headers.get("If-Modified-Since")
+        if if_modified_since is None or entry.last_modified is None:
+            return False
         try:
-            response = await http_client.fetch(http_request)
-            request_time = 1000.0 * getattr(response, "request_time", 0)
-            logging.info(
-                "{status} {method} {full_url} {duration:0.2f}ms {size}B".format(
-                    status=response.code,
-                    method=response.request.method,
-                    full_url=response.effective_url,
-                    duration=request_time,
-                    size=len(response.body),
-                )
+            return parsedate_to_datetime(entry.last_modified) <= parsedate_to_datetime(
+                if_modified_since
             )
+        except (TypeError, ValueError):
+            return False
 
-            logging.debug(f"{name} - response.headers: {response.headers!r}")
-            if self.settings.get("debug", False):
-                print("================ response.headers ================")
-                for header_name, header_value in response.headers.items():
-                    print(f"{header_name}: {header_value}")
-                print("================ response.headers ================")
+    def cached_range(self, entry: CacheEntry) -> tuple:
+        """Return the start and end of the part of a cached object requested
 
+        Sets a 206 status for a satisfiable `Range' request and a 416 status,
+        returning None, for an unsatisfiable one. Only single byte ranges are
+        supported, as with `tornado.web.StaticFileHandler'.
+        """
+        size = entry.size
+        range_header = self.request.headers.get("Range")
+        if range_header is None or not self.range_applies(entry):
+            return 0, size
+        request_range = tornado.httputil._parse_request_range(range_header)
+        if request_range is None:
+            return 0, size
+        start, end = request_range
+        if start is not None and start < 0:
+            start = max(0, start + size)
+        if (
+            start is not None and (start >= size or (end is not None and start >= end))
+        ) or end == 0:
+            self.set_status(416)
+            self.set_header("Content-Type", "text/plain")
+            self.set_header("Content-Range", f"bytes */{size}")
+            return None
+        start = start or 0
+        end = min(end or size, size)
+        if end - start != size:
+            self.set_status(206)
             self.set_header(
-                "Content-Type",
-                response.headers.get("Content-Type", "application/octet-stream"),
+                "Content-Range", tornado.httputil._get_content_range(start, end, size)
             )
-            if response.headers.get("Etag") is not None:
-                self.set_header("Etag", response.headers.get("Etag"))
-            if response.headers.get("Last-Modified") is not None:
-                self.set_header("Last-Modified", response.headers.get("Last-Modified"))
-            self.set_status(response.code)
-            if response.body and len(response.body) > 0:
-                self.write(response.body)
+        return start, end
 
-        except tornado.httpclient.HTTPError as err:
-            response = err.response
-            request_time = 1000.0 * getattr(response, "request_time", 0)
-            logging.warning(
-                "{status} {method} {full_url} {duration:0.2f}ms {size}B".format(
-                    status=response.code,
-                    method=response.request.method,
-                    full_url=response.effective_url,
-                    duration=request_time,
-                    size=len(response.body),
-                )
-            )
+    def range_applies(self, entry: CacheEntry) -> bool:
+        """Return False when `If-Range' does not match a cached object"""
+        if_range = self.request.headers.get("If-Range")
+        if if_range is None:
+            return True
+        if if_range.startswith(('"', "W/")):
+            return entry.etag is not None and if_range == entry.etag
+        return entry.last_modified is not None and if_range == entry.last_modified
 
-            logging.debug(f"{name} - response.headers: {response.headers!r}")
-            if self.settings.get("debug", False):
-                print("================ response.headers ================")
-                for header_name, header_value in response.headers.items():
-                    print(f"{header_name}: {header_value}")
-                print("================ response.headers ================")
-                print("================ response.body ================")
-                print(response.body)
-                print("================ response.body ================")
+    async def write_cached(self, entry: CacheEntry, cache_status: str):
+        """Respond with a cached object, or 304 when the client's copy is current
 
-            self.set_status(response.code)
+        Objects from the disk cache are read and sent in `stream_buffer_size'
+        chunks rather than being loaded into memory.
+        """
+        cache = self.settings["cache"]
+        if cache_status == "STALE":
+            cache.stale += 1
+        self.set_status(200)
+        self.set_cache_status(cache_status)
+        self.set_header("Age", int(cache.age(entry)))
+        self.set_header("Cache-Control", cache.cache_control())
+        self.set_header("Accept-Ranges", "bytes")
+        for header_name, header_value in entry.headers().items():
+            self.set_header(header_name, header_value)
+        if self.not_modified(entry):
+            self.set_status(304)
+            return
+        cached_range = self.cached_range(entry)
+        if cached_range is None:
+            return
+        start, end = cached_range
+        compressor = self.settings.get("compressor")
+        if (
+            compressor is not None
+            and self.request.method == "GET"
+            and self.get_status() == 200
+        ):
+            encoding = compressor.negotiate(
+                entry, self.request.headers.get("Accept-Encoding")
+            )
+            if encoding is not None:
+                body = await compressor.compress(
+                    cache, self.cache_key(), entry, encoding
+                )
+                self.set_header("Content-Encoding", encoding)
+                self.set_header("Content-Length", len(body))
+                if entry.etag is not None and not entry.etag.startswith("W/"):
+                    # The compressed copy is not byte for byte the object
+                    self.set_header("Etag", f"W/{entry.etag}")
+                self.write(body)
+                return
+        self.set_header("Content-Length", end - start)
+        if self.request.method == "HEAD":
+            return
+        if entry.body is not None:
+            self.write(entry.body[start:end])
+            return
 
+        buffer_size = int(self.settings.get("stream_buffer_size", 65536))
+        try:
+            with entry.reader() as file:
+                file.seek(entry.offset + start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = file.read(min(buffer_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    self.write(chunk)
+                    await self.flush()
+        except tornado.iostream.StreamClosedError:
+            return
         finally:
-            http_client.close()
+            entry.close()
 
-    def sign_request(self, **kwargs):
-        """Sign a request with a AWSv4 signature"""
-        name = "AWSv4Handler.sign_request"
-        logging.debug(f"{name} - **kwargs: {kwargs!r}")
+    def flush(self, include_footers: bool = False):
+        """Count the bytes sent and when the response started being written"""
+        if self.timings is not None and not self._headers_written:
+            self.set_header("Server-Timing", self.timings.header())
+        size = sum(len(chunk) for chunk in self._write_buffer)
+        self.bytes_sent += size
+        metrics = self.settings.get("metrics")
+        if metrics is not None:
+            if self.write_started is None:
+                self.write_started = time.monotonic()
+            metrics.bytes_sent += size
+        return super().flush(include_footers=include_footers)
 
-        algorithm = "AWS4-HMAC-SHA256"
-        now = datetime.datetime.utcnow()
-        amzdate = now.strftime("%Y%m%dT%H%M%SZ")
-        date = now.strftime("%Y%m%d")
+    def method_label(self) -> str:
+        """Return the request method, or OTHER when it is not supported
 
-        #
-        logging.debug(
-            f"{name} - self.request.body {type(self.request.body)}: length={len(self.request.body)}"
-        )
-        request_body_hash = hashlib.sha256(self.request.body).hexdigest()
-        logging.debug(f"{name} - request_body_hash: {request_body_hash!r}")
+        The method is chosen by the client, so it is bounded before being
+        used as a metric label or a key.
+        """
+        if self.request.method in self.SUPPORTED_METHODS:
+            return self.request.method
+        return "OTHER"
 
-        canonical_headers = (
-            "\n".join(
-                [
-                    f"host:{self.settings.get('endpoint')}",
-                    f"x-amz-content-sha256:{request_body_hash}",
-                    f"x-amz-date:{amzdate}",
-                ]
-            )
-            + "\n"
-        )  # include a trailing line break
-        logging.debug(f"{name} - canonical_headers: {canonical_headers!r}")
+    def set_cache_status(self, status: str):
+        """Set the `X-Cache' header, keeping its value for the access log"""
+        self.cache_status = status
+        self.set_header("X-Cache", status)
 
-        # This should match the header names used in canonical_headers
-        signed_headers = "host;x-amz-content-sha256;x-amz-date"
+    def clear(self):
+        """Reset the response, including its cache status"""
+        super().clear()
+        self.cache_status = None
 
-        canonical_request = "\n".join(
-            [
-                self.request.method,
-                f"/{self.settings.get('bucket')}{self.request.path}",
-                "",  # query string
-                canonical_headers,
-                signed_headers,
-                request_body_hash,
-            ]
-        )
-        logging.debug(f"{name} - canonical_request: {canonical_request!r}")
-        if self.settings.get("debug", False):
-            print("================ canonical_request ================")
-            print(canonical_request)
-            print("================ canonical_request ================")
+    def end_in_flight(self):
+        """Stop counting the request as in flight"""
+        if self.started is not None:
+            self.started = None
+            self.settings["metrics"].in_flight -= 1
 
-        credential_scope = "/".join(
-            [
-                date,
-                self.settings.get("region"),
-                self.settings.get("service"),
-                "aws4_request",
-            ]
-        )
-        logging.debug(f"{name} - credential_scope: {credential_scope!r}")
-        if self.settings.get("debug", False):
-            print("================ credential_scope ================")
-            print(credential_scope)
-            print("================ credential_scope ================")
+    def on_finish(self):
+        """Record metrics and drop cached copies of replaced or deleted objects"""
+        metrics = self.settings.get("metrics")
+        if metrics is not None:
+            metrics.requests[self.method_label()][self.get_status()] += 1
+            if self.write_started is not None:
+                metrics.client_write.observe(time.monotonic() - self.write_started)
+            self.end_in_flight()
+        self.end_admission()
+        if self.cache_entry is not None:
+            self.cache_entry.close()
+        # Only objects replaced or deleted upstream are dropped, so refused and
+        # auth-only requests can not purge the caches
+        if (
+            self.forwarded
+            and self.request.method in ["PUT", "DELETE"]
+            and 200 <= self.get_status() < 300
+        ):
+            for cache in [
+                self.settings.get("cache"),
+                self.settings.get("negative_cache"),
+                self.settings.get("metadata_index"),
+            ]:
+                if cache is not None:
+                    cache.pop(self.cache_key())
 
-        string_to_sign = "\n".join(
-            [
-                algorithm,
-                amzdate,
-                credential_scope,
-                hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
-            ]
-        )
-        logging.debug(f"{name} - string_to_sign: {string_to_sign!r}")
-        if self.settings.get("debug", False):
-            print("================ string_to_sign ================")
-            print(string_to_sign)
-            print("================ string_to_sign ================")
+    def sign_request(
+        self,
+        payload_hash: str | None = None,
+        headers: dict | None = None,
+        method: str | None = None,
+        query: dict | None = None,
+        **kwargs,
+    ):
+        """Sign a request with a AWSv4 signature
 
-        aws4_signature_key = self._get_aws4_signature(
-            secret_key=self.settings.get("secret_key"),
-            date=date,
-            region=self.settings.get("region"),
-            service=self.settings.get("service"),
+        Use `payload_hash' in place of the SHA256 of the request body and sign
+        any additional `headers' which are sent upstream. The `method' and
+        `query' parameters default to those of the request being handled.
+        """
+        name = "AWSv4Handler.sign_request"
+        logger.debug("%s - **kwargs: %r", name, kwargs)
+
+        started = time.perf_counter()
+        request_url, request_headers = self.signer.sign(
+            method or self.request.method,
+            self.object_path,
+            payload_hash=payload_hash or EMPTY_PAYLOAD,
+            headers=headers,
+            query=query,
         )
-        logging.debug(f"{name} - aws4_signature_key: {aws4_signature_key!r}")
+        elapsed = time.perf_counter() - started
+        if self.settings.get("metrics") is not None:
+            self.settings["metrics"].signing.observe(elapsed)
+        if self.timings is not None:
+            self.timings.add("sign", elapsed)
+        logger.debug("%s - request_headers: %r", name, request_headers)
+        logger.debug("%s - request_url: %r", name, request_url)
 
-        aws4_signature = hmac.new(
-            aws4_signature_key, (string_to_sign).encode("utf-8"), hashlib.sha256
-        ).hexdigest()
-        logging.debug(f"{name} - aws4_signature: {aws4_signature!r}")
+        return request_url, request_headers
 
-        authorization_header = " ".join(
-            [
-                algorithm,
-                f"Credential={self.settings.get('access_key')}/{credential_scope},",
-                f"SignedHeaders={signed_headers},Signature={aws4_signature}",
-            ]
+
+# -----------------------------------------------------------------------------
+def multipart_part_size(size: int, part_size: int = 16 * 1024**2) -> int:
+    """Return the part size for a multipart upload of `size' bytes
+
+    Parts are at least `part_size' bytes, and larger when needed to keep
+    the upload within the upstream limit on the number of parts.
+    """
+    return max(MIN_PART_SIZE, int(part_size), math.ceil(size / MAX_PARTS))
+
+
+def make_cache(**kwargs) -> ObjectCache:
+    """Return an object cache for the cache settings, or None when disabled"""
+    disk = None
+    if kwargs.get("cache_dir"):
+        disk = DiskCache(
+            directory=kwargs.get("cache_dir"),
+            max_size=int(kwargs.get("cache_disk_size") or 10 * 1024**3),
+            max_object_size=int(kwargs.get("cache_disk_object_size") or 1024**3),
         )
-        logging.debug(f"{name} - authorization_header: {authorization_header!r}")
+    if int(kwargs.get("cache_size") or 0) <= 0 and disk is None:
+        return None
+    return ObjectCache(
+        max_size=int(kwargs.get("cache_size") or 0),
+        max_object_size=int(kwargs.get("cache_object_size") or 1024**2),
+        ttl=float(kwargs.get("cache_ttl") or 0),
+        disk=disk,
+        stale_while_revalidate=float(kwargs.get("cache_stale_while_revalidate") or 0),
+        stale_if_error=float(kwargs.get("cache_stale_if_error") or 0),
+    )
 
-        request_headers = {
-            "x-amz-date": amzdate,
-            "x-amz-content-sha256": request_body_hash,
-            "Authorization": authorization_header,
-        }
-        logging.debug(f"{name} - request_headers: {request_headers!r}")
-        if self.settings.get("debug", False):
-            print("================ request_headers ================")
-            for header_name, header_value in request_headers.items():
-                print(f"{header_name}: {header_value}")
-            print("================ request_headers ================")
-
-        request_url = "".join(
-            [
-                self.settings.get("scheme"),
-                "://",
-                self.settings.get("endpoint"),
-                f"/{self.settings.get('bucket')}{self.request.path}",
-            ]
+
+def make_admission(**kwargs) -> AdmissionControl:
+    """Return the admission control for the limit settings, or None when unlimited"""
+    admission = AdmissionControl(
+        max_requests=int(kwargs.get("max_requests") or 0),
+        method_limits=kwargs.get("max_requests_per_method"),
+        queue_size=int(kwargs.get("admission_queue_size") or 0),
+        queue_timeout=float(kwargs.get("admission_queue_timeout") or 1.0),
+        max_buffered_bytes=int(kwargs.get("max_buffered_bytes") or 0),
+    )
+    if (
+        admission.max_requests > 0
+        or admission.method_limits
+        or admission.max_buffered_bytes > 0
+    ):
+        return admission
+    return None
+
+
+def make_router(**kwargs) -> Router:
+    """Return a router for the default backend and any configured `backends'
+
+    Each of `backends' is a dict of the settings of one backend. Settings it
+    does not include are those of the default backend. The `endpoint' of any
+    backend may be a comma-separated list of endpoints.
+    """
+    backend_settings = [
+        "bucket",
+        "endpoint",
+        "access_key",
+        "secret_key",
+        "region",
+        "service",
+        "scheme",
+    ]
+
+    def make_backend(name: str, settings: dict) -> Backend:
+        return Backend(
+            name=name,
+            bucket=settings.get("bucket", "NOT SET"),
+            endpoints=[
+                endpoint.strip()
+                for endpoint in str(settings.get("endpoint", "NOT SET")).split(",")
+                if endpoint.strip()
+            ],
+            access_key=settings.get("access_key", "NOT SET"),
+            secret_key=settings.get("secret_key", "NOT SET"),
+            region=settings.get("region", "NOT SET"),
+            service=settings.get("service"),
+            scheme=settings.get("scheme", "NOT SET"),
+            prefix=settings.get("prefix"),
+            host=settings.get("host"),
+            strip_prefix=bool(settings.get("strip_prefix", False)),
+            debug=kwargs.get("debug", False),
         )
-        logging.debug(f"{name} - request_url: {request_url!r}")
 
-        return request_url, request_headers
+    backends = []
+    for settings in kwargs.get("backends") or []:
+        backend_name = settings.get("name", "NOT SET")
+        if not settings.get("prefix") and not settings.get("host"):
+            raise ValueError(f"Backend {backend_name!r} needs a prefix or host")
+        merged = {key: kwargs[key] for key in backend_settings if key in kwargs}
+        merged.update(
+            (key, value) for key, value in settings.items() if value is not None
+        )
+        backends.append(make_backend(backend_name, merged))
+    return Router(
+        default=make_backend("default", kwargs),
+        backends=backends,
+        eject_failures=int(kwargs.get("eject_failures") or 5),
+        eject_time=float(kwargs.get("eject_time") or 30),
+    )
 
 
-# -----------------------------------------------------------------------------
 def make_app(*args, **kwargs):
     """Run a TornadoWeb HTTP Server"""
     name = "main"
@@ -409,7 +4565,7 @@ def make_app(*args, **kwargs):
             (r"/.*", AWSv4Handler),
         ],
     )
-    logging.debug(f"{name} - tornado.web.Application routes: {routes!r}")
+    logger.debug(f"{name} - tornado.web.Application routes: {routes!r}")
 
     # Enforce some default settings
     default_settings = {
@@ -421,6 +4577,63 @@ def make_app(*args, **kwargs):
         "scheme": "https",
         "admin": False,
         "auth_only": False,
+        "coalesce": True,
+        "metrics": True,
+        "parallel_range_size": 0,
+        "parallel_range_concurrency": 4,
+        "cache_size": 0,
+        "cache_object_size": 1024**2,
+        "cache_ttl": 60,
+        "cache_stale_while_revalidate": 0,
+        "cache_stale_if_error": 0,
+        "cache_dir": None,
+        "cache_disk_size": 10 * 1024**3,
+        "cache_disk_object_size": 1024**3,
+        "negative_cache_size": 0,
+        "negative_cache_ttl": 10,
+        "metadata_index_size": 0,
+        "metadata_index_ttl": 60,
+        "metadata_index_preload": False,
+        "compress_response": False,
+        "compress_encodings": "br,zstd,gzip",
+        "max_requests": 0,
+        "max_requests_per_method": None,
+        "admission_queue_size": 0,
+        "admission_queue_timeout": 1.0,
+        "max_buffered_bytes": 0,
+        "circuit_breaker": False,
+        "server_timing": False,
+        "http_client": "simple",
+        "max_clients": 10,
+        "keep_alive": True,
+        "queue_timeout": 0,
+        "retries": 0,
+        "retry_backoff": 0.05,
+        "hedge": False,
+        "hedge_quantile": 0.95,
+        "hedge_delay": 0,
+        "eject_failures": 5,
+        "eject_time": 30,
+        "probe_interval": 5,
+        "multipart_threshold": 0,
+        "multipart_part_size": 16 * 1024**2,
+        "multipart_concurrency": 4,
+        "payload_signing": "unsigned",
+        "stream_response": False,
+        "stream_buffer_size": 65536,
+        "sign_batch_size": 1000,
+        "list_objects": False,
+        "redirect": False,
+        "redirect_status": 307,
+        "redirect_expires": 300,
+        "redirect_size": 0,
+        "redirect_prefixes": None,
+        "access_log": "text",
+        "access_log_sample": None,
+        "log_queue_size": 10000,
+        "workers": 1,
+        "event_loop": "asyncio",
+        "shutdown_timeout": 10,
         "systemd": False,
         "verbose": False,
         "debug": False,
@@ -428,17 +4641,18 @@ def make_app(*args, **kwargs):
     for key in default_settings.keys():
         if kwargs.get(key) is None:
             kwargs[key] = default_settings.get(key)
-            logging.debug(f"{name} - setting default value {key!r} to: {kwargs[key]!r}")
+            logger.debug(f"{name} - setting default value {key!r} to: {kwargs[key]!r}")
 
     # tornado.web.Application settings
     # https://www.tornadoweb.org/en/stable/web.html#tornado.web.Application.settings
     if kwargs.get("admin", False):
-        logging.warning("Application has administrative methods enabled!")
+        logger.warning("Application has administrative methods enabled!")
+    metrics = Metrics() if kwargs.get("metrics", True) else None
+    router = make_router(**kwargs)
     app = tornado.web.Application(
         routes,
         autoreload=kwargs.get("debug", False),
         debug=kwargs.get("debug", False),
-        compress_response=kwargs.get("compress_response", False),
         allow_ipv6=kwargs.get("allow_ipv6", True),
         version=kwargs.get("version", "0.0.0a"),
         # None standard application settings
@@ -447,37 +4661,283 @@ def make_app(*args, **kwargs):
         auth_only=kwargs.get("auth_only", False),
         bucket=kwargs.get("bucket", "NOT SET"),
         endpoint=kwargs.get("endpoint", "NOT SET"),
+        list_objects=kwargs.get("list_objects", False),
+        multipart_concurrency=int(kwargs.get("multipart_concurrency", 4)),
+        multipart_part_size=int(kwargs.get("multipart_part_size", 16 * 1024**2)),
+        multipart_threshold=int(kwargs.get("multipart_threshold", 0)),
+        parallel_range_concurrency=int(kwargs.get("parallel_range_concurrency") or 4),
+        parallel_range_size=int(kwargs.get("parallel_range_size") or 0),
+        payload_signing=kwargs.get("payload_signing", "unsigned"),
+        redirect=kwargs.get("redirect", False),
+        redirect_expires=int(kwargs.get("redirect_expires") or 300),
+        redirect_prefixes=tuple(
+            prefix.strip()
+            for prefix in (kwargs.get("redirect_prefixes") or "").split(",")
+            if prefix.strip()
+        ),
+        redirect_size=int(kwargs.get("redirect_size") or 0),
+        redirect_status=int(kwargs.get("redirect_status") or 307),
         region=kwargs.get("region", "NOT SET"),
         scheme=kwargs.get("scheme", "NOT SET"),
         secret_key=kwargs.get("secret_key", "NOT SET"),
         service=kwargs.get("service"),
+        sign_batch_size=int(kwargs.get("sign_batch_size") or 1000),
+        stream_buffer_size=int(kwargs.get("stream_buffer_size", 65536)),
+        stream_response=kwargs.get("stream_response", False),
+        # Log requests through a sampled text or JSON access log
+        log_function=AccessLog(
+            log_format=kwargs.get("access_log") or "text",
+            sample=kwargs.get("access_log_sample"),
+        ),
+        # Share identical concurrent upstream requests
+        flights=SingleFlight() if kwargs.get("coalesce", True) else None,
+        # Cache objects in memory and optionally on disk
+        cache=make_cache(**kwargs),
+        # Limit the requests in progress and the memory they hold
+        admission=make_admission(**kwargs),
+        circuit_breaker=kwargs.get("circuit_breaker", False),
+        server_timing=kwargs.get("server_timing", False),
+        # Compress cached objects once per content encoding
+        compressor=ResponseCompressor(
+            encodings=tuple(
+                encoding.strip()
+                for encoding in (kwargs.get("compress_encodings") or "gzip").split(",")
+                if encoding.strip()
+            )
+        )
+        if kwargs.get("compress_response", False)
+        else None,
+        # Remember missing and forbidden objects
+        negative_cache=NegativeCache(
+            max_size=int(kwargs.get("negative_cache_size")),
+            ttl=float(kwargs.get("negative_cache_ttl") or 10),
+        )
+        if int(kwargs.get("negative_cache_size") or 0) > 0
+        else None,
+        # Index object metadata to answer HEAD requests
+        metadata_index=MetadataIndex(
+            max_size=int(kwargs.get("metadata_index_size")),
+            ttl=float(kwargs.get("metadata_index_ttl") or 60),
+        )
+        if int(kwargs.get("metadata_index_size") or 0) > 0
+        else None,
+        # Collect metrics for the /metrics endpoint
+        metrics=metrics,
+        # Share one upstream HTTP client per process
+        upstream=UpstreamPool(
+            backend=kwargs.get("http_client", "simple"),
+            max_clients=int(kwargs.get("max_clients", 10)),
+            keep_alive=kwargs.get("keep_alive", True),
+            queue_timeout=float(kwargs.get("queue_timeout") or 0) or None,
+            max_body_size=int(kwargs.get("max_body_size") or 5 * 1024**4),
+            metrics=metrics,
+            retries=int(kwargs.get("retries") or 0),
+            retry_backoff=float(kwargs.get("retry_backoff") or 0.05),
+            hedge=kwargs.get("hedge", False),
+            hedge_quantile=float(kwargs.get("hedge_quantile") or 0.95),
+            hedge_delay=float(kwargs.get("hedge_delay") or 0),
+            router=router,
+        ),
+        # Route requests to buckets and endpoints, each signing requests
+        # with cached signing keys
+        router=router,
     )
-    logging.debug(f"{name} - tornado.web.Application app: {app!r}")
+    logger.debug(f"{name} - tornado.web.Application app: {app!r}")
 
     return app
 
 
+def make_event_loop(event_loop: str = "asyncio") -> asyncio.AbstractEventLoop:
+    """Return a new event loop of an implementation
+
+    The `uvloop' implementation requires the uvloop package; `auto' uses it
+    when it is installed. Otherwise the asyncio event loop is used.
+
+    See Also:
+      https://github.com/MagicStack/uvloop
+    """
+    if event_loop not in ["asyncio", "uvloop", "auto"]:
+        raise ValueError(f"Unknown event loop {event_loop!r}")
+    if event_loop != "asyncio":
+        try:
+            import uvloop
+
+            return uvloop.new_event_loop()
+        except ImportError as err:
+            if event_loop == "uvloop":
+                logger.warning(f"Using the asyncio event loop: {err}")
+    return asyncio.new_event_loop()
+
+
+def fork_workers(num_workers: int, max_restarts: int = 100) -> int:
+    """Fork worker processes, returning the worker number in each worker
+
+    The parent process does not return. It restarts workers which exit
+    abnormally and forwards SIGINT/SIGTERM to the workers, exiting once they
+    have all stopped. Unlike `tornado.process.fork_processes', a worker which
+    exits because it was told to stop is not restarted.
+
+    See Also:
+      https://www.tornadoweb.org/en/stable/process.html#tornado.process.fork_processes
+    """
+    name = "fork_workers"
+    workers = {}
+    stopping = False
+
+    def start_worker(worker_id: int) -> bool:
+        pid = os.fork()
+        if pid == 0:
+            # Workers handle their own signals
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            random.seed()
+            return True
+        workers[pid] = worker_id
+        return False
+
+    def stop_workers(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    logger.info(f"{name} - starting {num_workers} worker processes")
+    for worker_id in range(num_workers):
+        if start_worker(worker_id):
+            return worker_id
+    signal.signal(signal.SIGINT, stop_workers)
+    signal.signal(signal.SIGTERM, stop_workers)
+
+    restarts = 0
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if pid not in workers:
+            continue
+        worker_id = workers.pop(pid)
+        exit_code = os.waitstatus_to_exitcode(status)
+        if stopping or exit_code == 0:
+            logger.info(f"{name} - worker {worker_id} (pid {pid}) stopped")
+            continue
+        logger.warning(
+            f"{name} - worker {worker_id} (pid {pid}) exited with {exit_code}, restarting"
+        )
+        restarts += 1
+        if restarts > max_restarts:
+            # Stop the remaining workers rather than leave them orphaned
+            stop_workers(signal.SIGTERM, None)
+            for pid in list(workers):
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            raise RuntimeError("Too many worker restarts, giving up")
+        if start_worker(worker_id):
+            return worker_id
+    sys.exit(0)
+
+
 def main(*args, **kwargs):
     """Run a Tornado application server"""
     name = "main"
-    logging.debug(f"{name} - *args: {args!r}")
-    logging.debug(f"{name} - **kwargs: {kwargs!r}")
+    logger.debug(f"{name} - *args: {args!r}")
+    logger.debug(f"{name} - **kwargs: {kwargs!r}")
 
-    # tornado.web.Application settings
+    # Bind the listening sockets before forking so every worker shares them
+    # https://www.tornadoweb.org/en/stable/netutil.html#tornado.netutil.bind_sockets
+    address = kwargs.get("address")
+    port = int(kwargs.get("port", 8888))
+    sockets = tornado.netutil.bind_sockets(port, address=address)
+    logger.info(f"Started listening at http://{address or '127.0.0.1'}:{port}/")
+
+    # Run one worker per CPU when `workers' is 0
+    workers = int(kwargs.get("workers") or 1)
+    if kwargs.get("workers") == 0:
+        workers = tornado.process.cpu_count()
+    if workers > 1:
+        worker_id = fork_workers(workers)
+        logger.info(f"{name} - worker {worker_id} started (pid {os.getpid()})")
+
+    # Each worker runs its own event loop, created after the fork
+    event_loop = make_event_loop(kwargs.get("event_loop") or "asyncio")
+    asyncio.set_event_loop(event_loop)
+    logger.debug(f"{name} - event loop: {event_loop!r}")
+
+    # Per-process state, such as the upstream pool and caches, is created by
+    # `make_app' in each worker after the fork
     # www.tornadoweb.org/en/stable/web.html#tornado.web.Application.settings
     app = make_app(**kwargs)
-    logging.debug(f"{name} - tornado.web.Application app: {app!r}")
+    logger.debug(f"{name} - tornado.web.Application app: {app!r}")
+
+    # Write JSON access log lines without the log format around them
+    if kwargs.get("access_log") == "json":
+        access_logger = logging.getLogger("tornado.access")
+        access_handler = logging.StreamHandler()
+        access_handler.setFormatter(logging.Formatter("%(message)s"))
+        access_logger.addHandler(access_handler)
+        access_logger.setLevel(logging.INFO)
+        access_logger.propagate = False
+    # Write log records from a background thread
+    log_listeners = []
+    log_queue_size = kwargs.get("log_queue_size")
+    if log_queue_size is None:
+        log_queue_size = 10000
+    if int(log_queue_size) > 0:
+        log_listeners = start_log_queue(int(log_queue_size))
 
     # tornado.httpserver.HTTPServer
     # https://www.tornadoweb.org/en/stable/httpserver.html#http-server
     # https://www.tornadoweb.org/en/stable/tcpserver.html
     server = tornado.httpserver.HTTPServer(app)
-    address = kwargs.get("address")
-    port = int(kwargs.get("port", 8888))
-    server.listen(port, address=address)
-    try:
-        logging.info(f"Started listening at http://{address or '127.0.0.1'}:{port}/")
-        server.start(1)
-        tornado.ioloop.IOLoop.current().start()
-    except KeyboardInterrupt:
-        logging.info(f"Stopped listening at http://{address or '127.0.0.1'}:{port}/")
+    server.add_sockets(sockets)
+    io_loop = tornado.ioloop.IOLoop.current()
+
+    async def shutdown():
+        """Stop accepting connections and wait on open ones before stopping"""
+        server.stop()
+        deadline = io_loop.time() + float(kwargs.get("shutdown_timeout") or 10)
+        while server._connections and io_loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        await server.close_all_connections()
+        io_loop.stop()
+
+    def handle_signal(signum, frame):
+        logger.info(f"{name} - received {signal.Signals(signum).name}, stopping")
+        io_loop.add_callback_from_signal(shutdown)
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    # Periodically report the upstream HTTP client occupancy
+    pool_report_interval = kwargs.get("pool_report_interval")
+    if pool_report_interval is None:
+        pool_report_interval = 60
+    if float(pool_report_interval) > 0:
+        tornado.ioloop.PeriodicCallback(
+            app.settings["upstream"].report, 1000.0 * float(pool_report_interval)
+        ).start()
+    # Periodically probe ejected upstream endpoints
+    probe_interval = kwargs.get("probe_interval")
+    if probe_interval is None:
+        probe_interval = 5
+    if float(probe_interval) > 0:
+        tornado.ioloop.PeriodicCallback(
+            functools.partial(app.settings["router"].probe, app.settings["upstream"]),
+            1000.0 * float(probe_interval),
+        ).start()
+    # Fill the metadata index from bucket listings
+    if kwargs.get("metadata_index_preload") and app.settings.get("metadata_index"):
+        io_loop.spawn_callback(
+            app.settings["metadata_index"].preload,
+            app.settings["router"],
+            app.settings["upstream"],
+        )
+    io_loop.start()
+    logger.info(f"Stopped listening at http://{address or '127.0.0.1'}:{port}/")
+    for listener in log_listeners:
+        listener.stop()
@@ -59,6 +59,24 @@ def handle_config(argv: argparse.Namespace, remaining_argv: list) -> dict:
                 f"DEBUG: argv.{key} {type(getattr(argv, key))}: {getattr(argv, key)!r} (after)"
             )
 
+    # Backends are named by a comma-separated list of sections, each holding
+    # the settings of one bucket. These sections are read without the values
+    # of the DEFAULT section so that unset values fall back to `section'.
+    if isinstance(getattr(argv, "backends", None), str):
+        backend_config = ConfigParser(default_section="DEFAULT BACKEND")
+        backend_config.read(argv.config)
+        backends = []
+        for backend in argv.backends.split(","):
+            backend = backend.strip()
+            if backend not in backend_config.sections():
+                print(f"Backend section {backend!r} not found in: {argv.config!r}")
+                continue
+            settings = {"name": backend}
+            for key, value in backend_config[backend].items():
+                settings[key] = to_type(value.split("#")[0].strip())
+            backends.append(settings)
+        argv.backends = backends
+
     # Return the updated `argv' and pass-through `remaining_argv' as-is
     return argv, remaining_argv
 
@@ -165,6 +183,25 @@ if __name__ == "__main__":
         type=int,
         help="Set the port this HTTP service will listen on",
     )
+    parser.add_argument(
+        "--workers",
+        metavar="<N>",
+        type=int,
+        help="Set the number of worker processes, 0 for one per CPU (Default: 1)",
+    )
+    parser.add_argument(
+        "--event-loop",
+        choices=["asyncio", "uvloop", "auto"],
+        dest="event_loop",
+        help="Set the event loop implementation; uvloop requires uvloop, auto uses it when installed (Default: asyncio)",
+    )
+    parser.add_argument(
+        "--shutdown-timeout",
+        metavar="<seconds>",
+        type=float,
+        dest="shutdown_timeout",
+        help="Set the time open connections are given to finish on shutdown (Default: 10)",
+    )
     parser.add_argument(
         "--admin", action="store_true", help="Enable administrative endpoints."
     )
@@ -175,6 +212,383 @@ if __name__ == "__main__":
         dest="auth_only",
         help="Enable authentication only.",
     )
+    parser.add_argument(
+        "--http-client",
+        choices=["simple", "curl"],
+        dest="http_client",
+        help="Set the upstream HTTP client backend; curl requires pycurl (Default: simple)",
+    )
+    parser.add_argument(
+        "--max-clients",
+        metavar="<N>",
+        type=int,
+        dest="max_clients",
+        help="Set the number of concurrent upstream requests (Default: 10)",
+    )
+    parser.add_argument(
+        "--keep-alive",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="keep_alive",
+        help="Reuse upstream connections (Default: enabled)",
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        metavar="<seconds>",
+        type=float,
+        dest="queue_timeout",
+        help="Set the time a request may wait for an upstream connection (Default: the connect timeout)",
+    )
+    parser.add_argument(
+        "--retries",
+        metavar="<N>",
+        type=int,
+        dest="retries",
+        help="Retry failed upstream GET/HEAD requests up to N times (Default: 0)",
+    )
+    parser.add_argument(
+        "--retry-backoff",
+        metavar="<seconds>",
+        type=float,
+        dest="retry_backoff",
+        help="Set the base of the jittered exponential backoff between retries (Default: 0.05)",
+    )
+    parser.add_argument(
+        "--hedge",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="hedge",
+        help="Send a second upstream GET/HEAD request when the first is slow (Default: disabled)",
+    )
+    parser.add_argument(
+        "--hedge-quantile",
+        metavar="<fraction>",
+        type=float,
+        dest="hedge_quantile",
+        help="Hedge requests slower than this quantile of recent requests (Default: 0.95)",
+    )
+    parser.add_argument(
+        "--hedge-delay",
+        metavar="<seconds>",
+        type=float,
+        dest="hedge_delay",
+        help="Hedge requests slower than this instead of a quantile (Default: 0, use the quantile)",
+    )
+    parser.add_argument(
+        "--eject-failures",
+        metavar="<N>",
+        type=int,
+        dest="eject_failures",
+        help="Eject an upstream endpoint after N consecutive failures (Default: 5)",
+    )
+    parser.add_argument(
+        "--eject-time",
+        metavar="<seconds>",
+        type=float,
+        dest="eject_time",
+        help="Set the time an ejected upstream endpoint is out of service (Default: 30)",
+    )
+    parser.add_argument(
+        "--probe-interval",
+        metavar="<seconds>",
+        type=float,
+        dest="probe_interval",
+        help="Set the interval between probes of ejected endpoints, 0 disables (Default: 5)",
+    )
+    parser.add_argument(
+        "--circuit-breaker",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="circuit_breaker",
+        help="Refuse requests with a 503 while every endpoint of their backend is ejected (Default: disabled)",
+    )
+    parser.add_argument(
+        "--max-requests",
+        metavar="<N>",
+        type=int,
+        dest="max_requests",
+        help="Set the number of requests handled at once, 0 for no limit (Default: 0)",
+    )
+    parser.add_argument(
+        "--max-requests-per-method",
+        metavar="<limits>",
+        dest="max_requests_per_method",
+        help="Set the requests handled at once by method, e.g. GET=200,PUT=20 (Default: no limit)",
+    )
+    parser.add_argument(
+        "--admission-queue-size",
+        metavar="<N>",
+        type=int,
+        dest="admission_queue_size",
+        help="Set the number of requests which wait for a place before 503s (Default: 0)",
+    )
+    parser.add_argument(
+        "--admission-queue-timeout",
+        metavar="<seconds>",
+        type=float,
+        dest="admission_queue_timeout",
+        help="Set the time requests wait for a place before a 503 (Default: 1)",
+    )
+    parser.add_argument(
+        "--max-buffered-bytes",
+        metavar="<bytes>",
+        type=int,
+        dest="max_buffered_bytes",
+        help="Hold new requests while bodies of this size are buffered, 0 for no limit (Default: 0)",
+    )
+    parser.add_argument(
+        "--pool-report-interval",
+        metavar="<seconds>",
+        type=float,
+        dest="pool_report_interval",
+        help="Set how often upstream connection pool usage is logged, 0 to disable (Default: 60)",
+    )
+    parser.add_argument(
+        "--multipart-threshold",
+        metavar="<bytes>",
+        type=int,
+        dest="multipart_threshold",
+        help="Use a multipart upload for uploads larger than this (Default: 0, disabled)",
+    )
+    parser.add_argument(
+        "--multipart-part-size",
+        metavar="<bytes>",
+        type=int,
+        dest="multipart_part_size",
+        help="Set the size of multipart upload parts (Default: 16777216)",
+    )
+    parser.add_argument(
+        "--multipart-concurrency",
+        metavar="<N>",
+        type=int,
+        dest="multipart_concurrency",
+        help="Set the number of multipart upload parts in flight (Default: 4)",
+    )
+    parser.add_argument(
+        "--payload-signing",
+        choices=["unsigned", "streaming"],
+        dest="payload_signing",
+        help="Set how streamed uploads are signed (Default: unsigned)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        default=None,
+        dest="stream_response",
+        help="Stream GET/HEAD responses to the client as they arrive.",
+    )
+    parser.add_argument(
+        "--stream-buffer-size",
+        metavar="<bytes>",
+        type=int,
+        dest="stream_buffer_size",
+        help="Set the bytes buffered per streamed response before a flush (Default: 65536)",
+    )
+    parser.add_argument(
+        "--sign-batch-size",
+        metavar="<N>",
+        type=int,
+        dest="sign_batch_size",
+        help="Set the most requests signed by one auth-only POST /sign request (Default: 1000)",
+    )
+    parser.add_argument(
+        "--list-objects",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="list_objects",
+        help="Stream bucket listings for GET /?list-type=2 as JSON or NDJSON (Default: disabled)",
+    )
+    parser.add_argument(
+        "--redirect",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="redirect",
+        help="Redirect GET requests to presigned URLs of the object store (Default: disabled)",
+    )
+    parser.add_argument(
+        "--redirect-status",
+        choices=[302, 307],
+        type=int,
+        dest="redirect_status",
+        help="Set the status code of redirects (Default: 307)",
+    )
+    parser.add_argument(
+        "--redirect-expires",
+        metavar="<seconds>",
+        type=int,
+        dest="redirect_expires",
+        help="Set the time presigned URLs are valid (Default: 300)",
+    )
+    parser.add_argument(
+        "--redirect-size",
+        metavar="<bytes>",
+        type=int,
+        dest="redirect_size",
+        help="Redirect only objects of at least this size (Default: 0, any size)",
+    )
+    parser.add_argument(
+        "--redirect-prefixes",
+        metavar="<prefix,...>",
+        dest="redirect_prefixes",
+        help="Redirect only objects below these comma-separated path prefixes (Default: all)",
+    )
+    parser.add_argument(
+        "--metrics",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="metrics",
+        help="Report Prometheus metrics at /metrics (Default: enabled)",
+    )
+    parser.add_argument(
+        "--server-timing",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="server_timing",
+        help="Add a Server-Timing header of signing and upstream times to responses (Default: disabled)",
+    )
+    parser.add_argument(
+        "--coalesce",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="coalesce",
+        help="Share one upstream request between identical concurrent GET/HEAD requests (Default: enabled)",
+    )
+    parser.add_argument(
+        "--parallel-range-size",
+        metavar="<bytes>",
+        type=int,
+        dest="parallel_range_size",
+        help="Fetch GET responses larger than this in ranges of this size concurrently (Default: 0, disabled)",
+    )
+    parser.add_argument(
+        "--parallel-range-concurrency",
+        metavar="<N>",
+        type=int,
+        dest="parallel_range_concurrency",
+        help="Set the number of ranges of a GET response in flight (Default: 4)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        metavar="<bytes>",
+        type=int,
+        dest="cache_size",
+        help="Set the memory used to cache objects (Default: 0, disabled)",
+    )
+    parser.add_argument(
+        "--cache-object-size",
+        metavar="<bytes>",
+        type=int,
+        dest="cache_object_size",
+        help="Set the size of the largest object which is cached (Default: 1048576)",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        metavar="<seconds>",
+        type=float,
+        dest="cache_ttl",
+        help="Set the time cached objects are used before revalidation (Default: 60)",
+    )
+    parser.add_argument(
+        "--cache-stale-while-revalidate",
+        metavar="<seconds>",
+        type=float,
+        dest="cache_stale_while_revalidate",
+        help="Serve expired objects while revalidating in the background for this time (Default: 0)",
+    )
+    parser.add_argument(
+        "--cache-stale-if-error",
+        metavar="<seconds>",
+        type=float,
+        dest="cache_stale_if_error",
+        help="Serve expired objects when upstream fails for this time (Default: 0)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="<path>",
+        dest="cache_dir",
+        help="Cache objects in files below this directory (Default: disabled)",
+    )
+    parser.add_argument(
+        "--cache-disk-size",
+        metavar="<bytes>",
+        type=int,
+        dest="cache_disk_size",
+        help="Set the disk space used to cache objects (Default: 10737418240)",
+    )
+    parser.add_argument(
+        "--cache-disk-object-size",
+        metavar="<bytes>",
+        type=int,
+        dest="cache_disk_object_size",
+        help="Set the size of the largest object which is cached on disk (Default: 1073741824)",
+    )
+    parser.add_argument(
+        "--compress-response",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="compress_response",
+        help="Compress responses of compressible types, once per cached object (Default: disabled)",
+    )
+    parser.add_argument(
+        "--compress-encodings",
+        metavar="<encodings>",
+        dest="compress_encodings",
+        help="Set the content encodings to use in order of preference (Default: br,zstd,gzip)",
+    )
+    parser.add_argument(
+        "--negative-cache-size",
+        metavar="<entries>",
+        type=int,
+        dest="negative_cache_size",
+        help="Remember this many missing or forbidden objects (Default: 0, disabled)",
+    )
+    parser.add_argument(
+        "--negative-cache-ttl",
+        metavar="<seconds>",
+        type=float,
+        dest="negative_cache_ttl",
+        help="Set the time missing or forbidden objects are remembered (Default: 10)",
+    )
+    parser.add_argument(
+        "--metadata-index-size",
+        metavar="<entries>",
+        type=int,
+        dest="metadata_index_size",
+        help="Index the metadata of this many objects to answer HEAD requests (Default: 0, disabled)",
+    )
+    parser.add_argument(
+        "--metadata-index-ttl",
+        metavar="<seconds>",
+        type=float,
+        dest="metadata_index_ttl",
+        help="Set the time indexed object metadata is used (Default: 60)",
+    )
+    parser.add_argument(
+        "--metadata-index-preload",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        dest="metadata_index_preload",
+        help="Fill the metadata index from bucket listings on start (Default: disabled)",
+    )
+    parser.add_argument(
+        "--access-log",
+        choices=["text", "json", "off"],
+        dest="access_log",
+        help="Set the access log format (Default: text)",
+    )
+    parser.add_argument(
+        "--access-log-sample",
+        metavar="<status=rate,...>",
+        dest="access_log_sample",
+        help="Log only a fraction of requests by status, e.g. 2xx=0.01,3xx=0.1 (Default: log all)",
+    )
+    parser.add_argument(
+        "--log-queue-size",
+        metavar="<N>",
+        type=int,
+        dest="log_queue_size",
+        help="Set the log records queued for the background log writer, 0 writes inline (Default: 10000)",
+    )
     parser.add_argument(
         "--version", "-V", action="version", version=f"version {__version__}"
     )